@@ -2,17 +2,20 @@
 """
 Flask web application for PR Review Agent
 """
-import os
-import json
-import threading
+import queue
 import time
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 import requests
 from dotenv import load_dotenv
 
 # Import our existing services
 from services.pr_analyzer import PRAnalyzer
-from services.git_providers import GitProviderFactory
+from services.events import TERMINAL_EVENTS, format_sse
+from services.git_providers import rate_limiter, response_cache
+from services.history_store import HistoryStore
+from services.job_queue import JobQueue, QueueFullError
+from services.review_pipeline import review_pr
+from services.telemetry import METRICS_CONTENT_TYPE, gauge_from, registry
 from models.feedback import ReviewFeedback, PRData
 
 # Load environment variables
@@ -20,10 +23,14 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# The static-analysis process pool spawns children that import this script
+# again, as __mp_main__; they only run rules and need none of the services
+IS_APP_PROCESS = __name__ != "__mp_main__"
+
 # Global variables
-analyzer = PRAnalyzer()
-current_feedback = None
-is_processing = False
+if IS_APP_PROCESS:
+    analyzer = PRAnalyzer()
+    history_store = HistoryStore()
 
 # HTML template for the improved UI
 HTML_TEMPLATE = """
@@ -422,6 +429,16 @@ HTML_TEMPLATE = """
             gap: 0.5rem;
         }
 
+        .token-stream {
+            margin-top: 1rem;
+            max-height: 200px;
+            overflow: hidden;
+            white-space: pre-wrap;
+            word-break: break-word;
+            font-size: 0.8rem;
+            color: var(--text-muted);
+        }
+
         .stats-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
@@ -535,24 +552,10 @@ HTML_TEMPLATE = """
             feedbackDiv.innerHTML = '';
             
             try {
-                // Submit PR for analysis
-                const response = await fetch('/analyze', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ prUrl: prUrl })
-                });
-                
-                if (response.ok) {
-                    // Poll for feedback
-                    const feedback = await pollForFeedback();
-                    displayFeedback(feedback);
-                    statusDiv.innerHTML = '';
-                } else {
-                    const error = await response.json();
-                    throw new Error(error.error || 'Analysis failed');
-                }
+                // Submit PR for analysis and follow its progress
+                const feedback = await streamFeedback(prUrl);
+                displayFeedback(feedback);
+                statusDiv.innerHTML = '';
             } catch (error) {
                 statusDiv.innerHTML = `
                     <div class="status-card">
@@ -571,42 +574,67 @@ HTML_TEMPLATE = """
             }
         });
         
-        async function pollForFeedback() {
-            const maxAttempts = 30;
-            let attempts = 0;
-            
-            while (attempts < maxAttempts) {
-                try {
-                    const response = await fetch('/feedback');
-                    if (response.ok) {
-                        return await response.json();
-                    } else if (response.status === 404) {
-                        attempts++;
-                        await new Promise(resolve => setTimeout(resolve, 2000));
-                        
-                        // Update progress
-                        const progress = Math.min(90, (attempts / maxAttempts) * 100);
-                        document.getElementById('status').innerHTML = `
-                            <div class="status-card">
-                                <div class="loading">
-                                    <div class="spinner"></div>
-                                    <div>
-                                        <strong>Processing... ${Math.round(progress)}%</strong><br>
-                                        <small>Analyzing code quality and generating insights</small>
-                                    </div>
-                                </div>
-                            </div>
-                        `;
+        function showProgress(title, detail, output) {
+            document.getElementById('status').innerHTML = `
+                <div class="status-card">
+                    <div class="loading">
+                        <div class="spinner"></div>
+                        <div>
+                            <strong>${title}</strong><br>
+                            <small>${detail}</small>
+                        </div>
+                    </div>
+                    ${output ? `<pre class="token-stream"></pre>` : ''}
+                </div>
+            `;
+            if (output) {
+                document.querySelector('#status .token-stream').textContent = output;
+            }
+        }
+        
+        function streamFeedback(prUrl) {
+            return new Promise((resolve, reject) => {
+                const source = new EventSource(`/analyze/stream?prUrl=${encodeURIComponent(prUrl)}`);
+                let chunks = 1;
+                let reviewed = 0;
+                let output = '';
+                let received = false;
+                
+                source.addEventListener('queued', () => {
+                    received = true;
+                    showProgress('Queued', 'Waiting for a free review worker...');
+                });
+                source.addEventListener('fetching', () => {
+                    showProgress('Fetching Pull Request', 'Downloading PR metadata and diff...');
+                });
+                source.addEventListener('diff_parsed', (e) => {
+                    chunks = JSON.parse(e.data).chunks;
+                    showProgress('Analyzing Pull Request', `Reviewing ${chunks} part(s) of the diff...`);
+                });
+                source.addEventListener('token', (e) => {
+                    // Keep the tail of the live model output visible
+                    output = (output + JSON.parse(e.data).text).slice(-2000);
+                    showProgress(`Processing... ${Math.round((reviewed / chunks) * 100)}%`, 'Analyzing code quality and generating insights', output);
+                });
+                source.addEventListener('chunk_reviewed', () => {
+                    reviewed++;
+                    showProgress(`Processing... ${Math.round((reviewed / chunks) * 100)}%`, `Reviewed ${reviewed} of ${chunks} part(s)`, output);
+                });
+                source.addEventListener('feedback', (e) => {
+                    source.close();
+                    resolve(JSON.parse(e.data));
+                });
+                source.addEventListener('error', (e) => {
+                    source.close();
+                    if (e.data) {
+                        reject(new Error(JSON.parse(e.data).message));
+                    } else if (!received) {
+                        reject(new Error('Analysis could not be started - the server may be busy, please try again'));
                     } else {
-                        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                        reject(new Error('Connection to the server was lost'));
                     }
-                } catch (error) {
-                    attempts++;
-                    await new Promise(resolve => setTimeout(resolve, 2000));
-                }
-            }
-            
-            throw new Error('Analysis timeout - please try again');
+                });
+            });
         }
         
         function displayFeedback(feedback) {
@@ -728,51 +756,28 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def process_pr_async(pr_url):
-    """Process PR in a separate thread"""
-    global current_feedback, is_processing
+async def process_pr_job(job):
+    """Review the PR of a queued job and record it in the history"""
+    pr_data, feedback = await review_pr(job.pr_url, analyzer, job.on_event)
+    save_to_history(job.pr_url, feedback, pr_data)
+    return feedback
+
+if IS_APP_PROCESS:
+    # Bounded worker pool; sizes come from JOB_WORKERS / JOB_QUEUE_DEPTH
+    job_queue = JobQueue(process_pr_job)
     
-    try:
-        # Parse PR URL to determine provider
-        provider = GitProviderFactory.get_provider(pr_url)
-        
-        # Get PR data (this might be async)
-        import asyncio
-        pr_data = asyncio.run(provider.get_pr_data(pr_url))
-        
-        # Analyze the PR (this is async)
-        feedback = asyncio.run(analyzer.analyze_pr(pr_data))
-        
-        # Save feedback
-        current_feedback = feedback
-        
-        # Save to history
-        save_to_history(pr_url, feedback, pr_data)
-        
-    except Exception as e:
-        current_feedback = {
-            "summary": f"Error processing PR: {str(e)}",
-            "score": 0,
-            "issues": [],
-            "recommendations": [],
-            "error": True
-        }
-    finally:
-        is_processing = False
+    # Read when /metrics is scraped
+    gauge_from("pr_review_queue_jobs", "Review jobs in the in-process queue by status",
+               lambda: {("queued",): job_queue.stats()["queued"], ("running",): job_queue.stats()["processing"]},
+               ("status",))
+    gauge_from("pr_review_cache_hit_ratio", "Hit ratio of the review and provider HTTP caches",
+               lambda: {("review",): analyzer.cache.stats()["hit_ratio"], ("http",): response_cache.stats()["hit_ratio"]},
+               ("cache",))
 
 def save_to_history(pr_url, feedback, pr_data):
-    """Save analysis to history file"""
+    """Save analysis to the history store"""
     try:
-        history_file = "analysis_history.json"
-        history = []
-        
-        # Load existing history
-        if os.path.exists(history_file):
-            with open(history_file, 'r') as f:
-                history = json.load(f)
-        
-        # Add new entry
-        entry = {
+        history_store.add({
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             "pr_url": pr_url,
             "pr_title": getattr(pr_data, 'title', 'Unknown'),
@@ -780,16 +785,7 @@ def save_to_history(pr_url, feedback, pr_data):
             "score": feedback.score if hasattr(feedback, 'score') else feedback.get('score', 0),
             "issues_count": len(feedback.issues) if hasattr(feedback, 'issues') else len(feedback.get('issues', [])),
             "summary": feedback.summary if hasattr(feedback, 'summary') else feedback.get('summary', '')
-        }
-        
-        # Keep only last 50 entries
-        history.insert(0, entry)
-        history = history[:50]
-        
-        # Save back to file
-        with open(history_file, 'w') as f:
-            json.dump(history, f, indent=2)
-            
+        })
     except Exception as e:
         print(f"Error saving to history: {e}")
 
@@ -800,9 +796,7 @@ def index():
 
 @app.route('/analyze', methods=['POST'])
 def analyze_pr():
-    """Analyze a pull request and generate feedback"""
-    global is_processing
-    
+    """Queue a pull request for analysis and return its job ID"""
     try:
         data = request.get_json()
         pr_url = data.get('prUrl')
@@ -810,70 +804,134 @@ def analyze_pr():
         if not pr_url:
             return jsonify({"error": "PR URL is required"}), 400
         
-        # Set processing flag
-        is_processing = True
-        
-        # Start processing in a separate thread
-        thread = threading.Thread(target=process_pr_async, args=(pr_url,))
-        thread.start()
+        job = job_queue.submit(pr_url)
         
-        return jsonify({"message": "PR analysis started"})
+        return jsonify({"message": "PR analysis started", "job_id": job.id}), 202
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
     except Exception as e:
-        is_processing = False
         return jsonify({"error": str(e)}), 500
 
-@app.route('/feedback')
-def get_feedback():
-    """Get the latest feedback if available"""
-    global current_feedback
+@app.route('/analyze/stream')
+def analyze_pr_stream():
+    """Queue a pull request for analysis and stream its progress as Server-Sent Events"""
+    pr_url = request.args.get('prUrl')
+    if not pr_url:
+        return jsonify({"error": "PR URL is required"}), 400
     
+    events = queue.Queue()
     try:
-        if current_feedback:
-            # Convert to dict if it's a Pydantic model
-            if hasattr(current_feedback, 'model_dump'):
-                return jsonify(current_feedback.model_dump())
-            elif hasattr(current_feedback, 'dict'):
-                return jsonify(current_feedback.dict())
-            else:
-                return jsonify(current_feedback)
-        else:
-            return jsonify({"error": "Feedback not ready yet"}), 404
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        job = job_queue.submit(pr_url, on_event=lambda event, data: events.put((event, data)))
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    
+    def generate():
+        yield format_sse("queued", {"job_id": job.id})
+        while True:
+            try:
+                event, data = events.get(timeout=15)
+            except queue.Empty:
+                if job.is_finished:
+                    break
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event, data)
+            if event in TERMINAL_EVENTS:
+                break
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def feedback_response(job):
+    """Build the /feedback response for a job"""
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status == "completed":
+        return jsonify(job.result.model_dump())
+    if job.status == "failed":
+        return jsonify({
+            "summary": f"Error processing PR: {job.error}",
+            "score": 0,
+            "issues": [],
+            "recommendations": [],
+            "error": True
+        })
+    return jsonify({"error": "Feedback not ready yet", "status": job.status}), 404
+
+@app.route('/feedback/<job_id>')
+def get_job_feedback(job_id):
+    """Get the feedback of a job once it has finished"""
+    return feedback_response(job_queue.get(job_id))
+
+@app.route('/feedback')
+def get_feedback():
+    """Get the feedback of the most recently submitted job"""
+    if job_queue.latest_job_id is None:
+        return jsonify({"error": "Feedback not ready yet"}), 404
+    return feedback_response(job_queue.get(job_queue.latest_job_id))
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy"})
+    return jsonify({
+        "status": "healthy",
+        "review_cache": analyzer.cache.stats(),
+        "http_cache": response_cache.stats(),
+        "rate_limits": rate_limiter.stats()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of this process"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/history')
 def get_history():
-    """Get analysis history"""
+    """Get a page of analysis history, optionally filtered"""
     try:
-        history_file = "analysis_history.json"
-        if os.path.exists(history_file):
-            with open(history_file, 'r') as f:
-                history = json.load(f)
-            return jsonify(history)
-        else:
-            return jsonify([])
+        page = request.args.get('page', 1, type=int)
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+        items, total = history_store.query(
+            page=page,
+            per_page=per_page,
+            pr_url=request.args.get('pr_url'),
+            author=request.args.get('author'),
+            min_score=request.args.get('min_score', type=int),
+            max_score=request.args.get('max_score', type=int),
+            since=request.args.get('since'),
+            until=request.args.get('until')
+        )
+        return jsonify({"items": items, "total": total, "page": page, "per_page": per_page})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/clear-feedback', methods=['POST'])
 def clear_feedback():
-    """Clear current feedback"""
-    global current_feedback
-    current_feedback = None
+    """Forget the most recently submitted job"""
+    job_queue.latest_job_id = None
     return jsonify({"message": "Feedback cleared"})
 
+@app.route('/status/<job_id>')
+def get_job_status(job_id):
+    """Get the processing status of a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/status')
 def get_status():
-    """Get current processing status"""
-    global is_processing
+    """Get the status of the most recent job and of the queue"""
+    job = job_queue.get(job_queue.latest_job_id) if job_queue.latest_job_id else None
     return jsonify({
-        "is_processing": is_processing,
-        "has_feedback": current_feedback is not None
+        "is_processing": job is not None and not job.is_finished,
+        "has_feedback": job is not None and job.is_finished,
+        "job": job.to_dict() if job else None,
+        "queue": job_queue.stats()
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,304 @@
+"""
+Provider and OpenAI responses for offline benchmarks, in the shapes the real APIs return
+
+    python benchmarks/fixtures.py --provider gitlab --files 500 --record fixtures/gitlab-500
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+
+PROVIDERS = ("github", "gitlab", "bitbucket")
+
+# Code the synthetic hunks are made of; some of it trips the static-analysis rules
+_CODE = [
+    "result = compute(items, limit=10)",
+    "for item in items:",
+    "    total += item.value",
+    "if not config.get('enabled'):",
+    "    return None",
+    "logger.info('processed %d items', len(items))",
+    "print(response.status_code)",
+    "session.commit()",
+    "except Exception:",
+    "    pass",
+    "data = json.loads(payload)",
+    "# TODO: handle pagination",
+]
+
+# What the model answers for every chunk
+REVIEW = {
+    "summary": "The change is straightforward; a few spots need attention.",
+    "score": 82,
+    "issues": [
+        {
+            "type": "warning",
+            "file": "src/module0.py",
+            "line": 3,
+            "message": "Broad exception handler swallows errors",
+            "suggestion": "Catch the specific exception and log it",
+        },
+        {
+            "type": "info",
+            "file": "src/module0.py",
+            "line": 5,
+            "message": "Debug print left in",
+            "suggestion": "Use the logger instead",
+        },
+    ],
+    "recommendations": ["Add tests for the new branches"],
+}
+
+
+class Response:
+    """A canned HTTP response, independent of any client or server library"""
+
+    def __init__(self, status: int, body: Any = b"", headers: Optional[Dict[str, str]] = None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        self.status = status
+        self.body = body if isinstance(body, bytes) else body.encode()
+        self.headers = headers or {}
+
+
+class PRFixture:
+    """A synthetic pull request of `files` changed files, served the way `provider` would.
+
+    Every PR number is a different PR with the same changes, so repeated
+    reviews miss the review cache. Responses can be `record`ed to a
+    directory and replayed from it with `load`; replayed responses are
+    served for every PR number.
+    """
+
+    def __init__(self, provider: str = "github", files: int = 20, lines_per_file: int = 12, seed: int = 0):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider}")
+        self.provider = provider
+        self.files = files
+        rng = random.Random(seed)
+        self.changes = [self._file_change(index, lines_per_file, rng) for index in range(files)]
+        self.diff = "".join(
+            f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n{patch}\n" for path, patch in self.changes
+        ).encode()
+        self._recorded: Dict[str, Response] = {}
+
+    @staticmethod
+    def _file_change(index: int, lines: int, rng: random.Random) -> Tuple[str, str]:
+        body = [" import json"] + ["+" + rng.choice(_CODE) for _ in range(lines)] + [" "]
+        return f"src/module{index}.py", f"@@ -1,2 +1,{lines + 2} @@\n" + "\n".join(body)
+
+    def pr_url(self, number: int) -> str:
+        return {
+            "github": f"https://github.com/bench/repo/pull/{number}",
+            "gitlab": f"https://gitlab.com/bench/repo/-/merge_requests/{number}",
+            "bitbucket": f"https://bitbucket.org/bench/repo/pull-requests/{number}",
+        }[self.provider]
+
+    @staticmethod
+    def head_sha(number: int) -> str:
+        return hashlib.sha1(str(number).encode()).hexdigest()
+
+    def respond(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        """The provider's answer to one API request"""
+        recorded = self._recorded.get(_replay_key(method, url, headers))
+        if recorded is not None:
+            return recorded
+        parts = urlsplit(url)
+        path = unquote(parts.path)
+        accept = _accept(headers)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        match = re.search(r"/repos/[^/]+/[^/]+/pulls/(\d+)(/files)?$", path)
+        if match and self.provider == "github":
+            number = int(match.group(1))
+            if match.group(2):
+                per_page = int(query.get("per_page", 30))
+                page = int(query.get("page", 1))
+                return Response(200, [
+                    {"filename": name, "status": "modified", "additions": patch.count("\n+"),
+                     "deletions": 0, "changes": patch.count("\n+"), "patch": patch}
+                    for name, patch in self.changes[(page - 1) * per_page:page * per_page]
+                ])
+            if "diff" in accept:
+                return Response(200, self.diff, {"Content-Type": "text/plain; charset=utf-8"})
+            return Response(200, {
+                "number": number, "title": f"Benchmark PR {number}", "body": "Synthetic change",
+                "user": {"login": "bench"}, "head": {"sha": self.head_sha(number)},
+                "changed_files": self.files, "html_url": self.pr_url(number),
+            })
+
+        match = re.search(r"/projects/[^/]+/[^/]+/merge_requests/(\d+)(/changes)?$", path)
+        if match and self.provider == "gitlab":
+            number = int(match.group(1))
+            if match.group(2):
+                return Response(200, {"changes": [
+                    {"old_path": name, "new_path": name, "new_file": False, "deleted_file": False, "diff": patch}
+                    for name, patch in self.changes
+                ]})
+            return Response(200, {
+                "iid": number, "title": f"Benchmark MR {number}", "description": "Synthetic change",
+                "author": {"username": "bench"}, "sha": self.head_sha(number), "web_url": self.pr_url(number),
+            })
+
+        match = re.search(r"/repositories/[^/]+/[^/]+/pullrequests/(\d+)(/diff)?$", path)
+        if match and self.provider == "bitbucket":
+            number = int(match.group(1))
+            if match.group(2):
+                return Response(200, self.diff, {"Content-Type": "text/plain; charset=utf-8"})
+            return Response(200, {
+                "id": number, "title": f"Benchmark PR {number}", "description": "Synthetic change",
+                "author": {"username": "bench"}, "source": {"commit": {"hash": self.head_sha(number)}},
+                "links": {"html": {"href": self.pr_url(number)}},
+            })
+
+        return Response(404, {"message": "Not Found"})
+
+    def record(self, directory: str) -> None:
+        """Write the responses a review fetches, for replay with `load`"""
+        os.makedirs(directory, exist_ok=True)
+        index = []
+        for method, url, headers in self._requests(1):
+            response = self.respond(method, url, headers)
+            key = _replay_key(method, url, headers)
+            name = hashlib.sha1(key.encode()).hexdigest()[:16] + ".body"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(response.body)
+            index.append({"key": key, "status": response.status, "headers": response.headers, "body": name})
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"provider": self.provider, "files": self.files, "responses": index}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> "PRFixture":
+        """Replay responses written by `record`, or captured from a real provider in the same layout"""
+        with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        fixture = cls(index["provider"], 0)
+        fixture.files = index["files"]
+        for entry in index["responses"]:
+            with open(os.path.join(directory, entry["body"]), "rb") as f:
+                fixture._recorded[entry["key"]] = Response(entry["status"], f.read(), entry["headers"])
+        return fixture
+
+    def _requests(self, number: int) -> List[Tuple[str, str, Dict[str, str]]]:
+        if self.provider == "github":
+            api = f"https://api.github.com/repos/bench/repo/pulls/{number}"
+            pages = max(1, -(-self.files // 100))
+            return [("GET", api, {}), ("GET", api, {"Accept": "application/vnd.github.v3.diff"})] + [
+                ("GET", f"{api}/files?per_page=100&page={page}", {}) for page in range(1, min(pages, 30) + 1)
+            ]
+        if self.provider == "gitlab":
+            api = f"https://gitlab.com/api/v4/projects/bench%2Frepo/merge_requests/{number}"
+            return [("GET", api, {}), ("GET", f"{api}/changes", {})]
+        api = f"https://api.bitbucket.org/2.0/repositories/bench/repo/pullrequests/{number}"
+        return [("GET", api, {}), ("GET", f"{api}/diff", {})]
+
+
+def _accept(headers: Optional[Dict[str, str]]) -> str:
+    return {key.lower(): value for key, value in (headers or {}).items()}.get("accept", "")
+
+
+def _replay_key(method: str, url: str, headers: Optional[Dict[str, str]] = None) -> str:
+    """Identifies a request whatever PR number it is for; diffs and JSON of one URL differ by Accept"""
+    parts = urlsplit(url)
+    path = re.sub(r"/(pulls|merge_requests|pullrequests)/\d+", r"/\1/{number}", unquote(parts.path))
+    return f"{method} {path}?{parts.query}{' diff' if 'diff' in _accept(headers) else ''}"
+
+
+def review_for(prompt: str) -> Dict[str, Any]:
+    """`REVIEW`, with its issues moved to the first file of the diff in `prompt`"""
+    match = re.search(r"^\+\+\+ b/(\S+)", prompt, re.MULTILINE)
+    if match is None:
+        return REVIEW
+    return {**REVIEW, "issues": [{**issue, "file": match.group(1)} for issue in REVIEW["issues"]]}
+
+
+def tool_name(payload: Dict[str, Any]) -> Optional[str]:
+    """The function a completion request forces the model to call, if any"""
+    choice = payload.get("tool_choice")
+    if isinstance(choice, dict):
+        return (choice.get("function") or {}).get("name")
+    return None
+
+
+def completion_events(
+    model: str = "gpt-3.5-turbo", review: Optional[Dict[str, Any]] = None, tool: Optional[str] = None
+) -> List[str]:
+    """The server-sent events of a streamed completion answering with `review`, `[DONE]` last.
+
+    With `tool` the review comes as the arguments of a call to that function.
+    """
+    content = json.dumps(review or REVIEW)
+    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": model}
+    if tool is None:
+        deltas = [{"content": content[start:start + 16]} for start in range(0, len(content), 16)]
+    else:
+        deltas = [{"tool_calls": [{"index": 0, "id": "call_bench", "type": "function",
+                                   "function": {"name": tool, "arguments": ""}}]}] + [
+            {"tool_calls": [{"index": 0, "function": {"arguments": content[start:start + 16]}}]}
+            for start in range(0, len(content), 16)
+        ]
+    events = [{**chunk, "choices": [{"index": 0, "finish_reason": None, "delta": delta}]} for delta in deltas]
+    events.append({**chunk, "choices": [{"index": 0, "finish_reason": "stop" if tool is None else "tool_calls",
+                                         "delta": {}}]})
+    return [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+
+
+def completion(
+    model: str = "gpt-3.5-turbo", stream: bool = False, review: Optional[Dict[str, Any]] = None,
+    tool: Optional[str] = None
+) -> Response:
+    """An OpenAI chat completion answering with `review`, as JSON or as a server-sent event stream"""
+    if stream:
+        return Response(200, "".join(completion_events(model, review, tool)), {"Content-Type": "text/event-stream"})
+    content = json.dumps(review or REVIEW)
+    if tool is None:
+        message = {"role": "assistant", "content": content}
+    else:
+        message = {"role": "assistant", "content": None, "tool_calls": [
+            {"id": "call_bench", "type": "function", "function": {"name": tool, "arguments": content}}
+        ]}
+    return Response(200, {
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop" if tool is None else "tool_calls", "message": message}],
+        "usage": {"prompt_tokens": 1500, "completion_tokens": len(content) // 4,
+                  "total_tokens": 1500 + len(content) // 4},
+    })
+
+
+def fixture_transport(fixture: PRFixture, provider_latency: float = 0.0, llm_latency: float = 0.0) -> httpx.MockTransport:
+    """An httpx transport answering provider and OpenAI requests from `fixture` after the given delays"""
+    async def handle(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/chat/completions"):
+            await asyncio.sleep(llm_latency)
+            payload = json.loads(request.content or b"{}")
+            prompt = "\n".join(str(message.get("content")) for message in payload.get("messages", []))
+            response = completion(
+                payload.get("model", "gpt-3.5-turbo"), bool(payload.get("stream")), review_for(prompt), tool_name(payload)
+            )
+        else:
+            await asyncio.sleep(provider_latency)
+            response = fixture.respond(request.method, str(request.url), dict(request.headers))
+        return httpx.Response(response.status, content=response.body, headers=response.headers)
+    return httpx.MockTransport(handle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--provider", choices=PROVIDERS, default="github")
+    parser.add_argument("--files", type=int, default=20, help="Changed files per PR (default 20)")
+    parser.add_argument("--record", required=True, help="Directory to write the responses to")
+    args = parser.parse_args()
+    PRFixture(args.provider, args.files).record(args.record)
+    print(json.dumps({"directory": args.record, "provider": args.provider, "files": args.files}))
+
+
+if __name__ == "__main__":
+    main()
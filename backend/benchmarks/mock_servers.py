@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for OpenAI and the GitHub, GitLab and Bitbucket APIs, for load tests
+
+    python benchmarks/mock_servers.py --port 9000 --llm-latency 1500 --llm-error-rate 0.02
+
+Point the backend at it with the variables it prints. Reviews then use
+normal PR URLs; a repository named `files-<n>` has PRs of n changed files,
+any other repository has PRs of --files files:
+
+    https://github.com/acme/files-2000/pull/17
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fixtures import PRFixture, completion, completion_events, review_for, tool_name
+
+# Mount points of each emulated API
+PREFIXES = {
+    "openai": "/openai/v1",
+    "github": "/github",
+    "gitlab": "/gitlab/api/v4",
+    "bitbucket": "/bitbucket/2.0",
+}
+
+_REPOSITORY_SIZE = re.compile(r"/files-(\d+)/")
+
+
+def environment(base_url: str) -> Dict[str, str]:
+    """The variables that send the backend's API calls to these servers"""
+    return {
+        "OPENAI_BASE_URL": base_url + PREFIXES["openai"],
+        "GITHUB_API_URL": base_url + PREFIXES["github"],
+        "GITLAB_API_URL": base_url + PREFIXES["gitlab"],
+        "BITBUCKET_API_URL": base_url + PREFIXES["bitbucket"],
+    }
+
+
+def create_app(
+    files: int = 20,
+    llm_latency: float = 1.0,
+    llm_jitter: float = 0.2,
+    llm_error_rate: float = 0.0,
+    stream_interval: float = 0.0,
+    provider_latency: float = 0.05,
+    provider_error_rate: float = 0.0,
+    seed: int = 0,
+) -> FastAPI:
+    """The mock APIs; latencies are in seconds, jitter is a fraction of the latency"""
+    app = FastAPI(title="PR Review Agent mock APIs")
+    rng = random.Random(seed)
+
+    @lru_cache(maxsize=32)
+    def fixture(provider: str, size: int) -> PRFixture:
+        return PRFixture(provider, size)
+
+    async def delay(latency: float) -> None:
+        await asyncio.sleep(max(0.0, latency * (1 + rng.uniform(-llm_jitter, llm_jitter))))
+
+    @app.post(PREFIXES["openai"] + "/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "gpt-3.5-turbo")
+        await delay(llm_latency)
+        if rng.random() < llm_error_rate:
+            # Half rate limits, half server errors: both are retried by the analyzer
+            if rng.random() < 0.5:
+                return Response(json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}),
+                                status_code=429, media_type="application/json", headers={"Retry-After": "1"})
+            return Response(json.dumps({"error": {"message": "The server had an error", "type": "server_error"}}),
+                            status_code=500, media_type="application/json")
+        prompt = "\n".join(str(message.get("content")) for message in payload.get("messages", []))
+        review = review_for(prompt)
+        tool = tool_name(payload)
+        if not payload.get("stream"):
+            answer = completion(model, review=review, tool=tool)
+            return Response(answer.body, status_code=answer.status, headers=answer.headers)
+
+        async def events() -> AsyncIterator[str]:
+            for event in completion_events(model, review, tool):
+                yield event
+                if stream_interval:
+                    await asyncio.sleep(stream_interval)
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/{provider}/{path:path}")
+    async def provider_api(provider: str, path: str, request: Request):
+        if provider not in ("github", "gitlab", "bitbucket"):
+            return Response(status_code=404)
+        await asyncio.sleep(provider_latency)
+        if rng.random() < provider_error_rate:
+            return Response(json.dumps({"message": "Server Error"}), status_code=502, media_type="application/json")
+        size = _REPOSITORY_SIZE.search(request.url.path)
+        answer = fixture(provider, min(int(size.group(1)), 5000) if size else files).respond(
+            request.method, str(request.url), dict(request.headers)
+        )
+        return Response(answer.body, status_code=answer.status, headers=answer.headers)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000, help="Port to listen on (default 9000)")
+    parser.add_argument("--files", type=int, default=20, help="Changed files of PRs in other repositories (default 20)")
+    parser.add_argument("--llm-latency", type=float, default=1000, help="Milliseconds before a completion starts (default 1000)")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Random spread of the latency, as a fraction (default 0.2)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of completions failing with 429 or 500 (default 0)")
+    parser.add_argument("--stream-interval", type=float, default=10, help="Milliseconds between streamed chunks (default 10)")
+    parser.add_argument("--provider-latency", type=float, default=50, help="Milliseconds per provider call (default 50)")
+    parser.add_argument("--provider-error-rate", type=float, default=0.0, help="Share of provider calls failing with 502 (default 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the jitter and the errors (default 0)")
+    args = parser.parse_args()
+
+    app = create_app(
+        files=args.files,
+        llm_latency=args.llm_latency / 1000,
+        llm_jitter=args.llm_jitter,
+        llm_error_rate=args.llm_error_rate,
+        stream_interval=args.stream_interval / 1000,
+        provider_latency=args.provider_latency / 1000,
+        provider_error_rate=args.provider_error_rate,
+        seed=args.seed,
+    )
+    print("🧪 Mock APIs ready; point the backend at them with:", file=sys.stderr)
+    for name, value in environment(f"http://{args.host}:{args.port}").items():
+        print(f"export {name}={value}", file=sys.stderr)
+    # No access log: at thousands of requests a second it costs more than the mocks
+    uvicorn.run(app, host=args.host, port=args.port, access_log=False, log_level="warning", backlog=4096)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Review throughput of the Flask app, the FastAPI app and the CLI against offline fixtures
+
+    python benchmarks/review_throughput.py --files 200 --reviews 50 --output report.json
+
+Each target runs in a fresh process, so its peak RSS is its own. Provider
+and OpenAI calls are answered from `fixtures.py` after the injected
+latencies; nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+TARGETS = ("flask", "fastapi", "cli")
+
+# Seconds between status polls of a queued Flask job
+FLASK_POLL_SECONDS = 0.005
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: List[float], failures: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "reviews": len(latencies) + failures,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "reviews_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1
+        ),
+    }
+
+
+def install_fixtures(args) -> Callable[[int], str]:
+    """Route every pooled HTTP client to the fixtures; returns the URL of PR `number`"""
+    from fixtures import PRFixture, fixture_transport
+    from services import http_client
+
+    fixture = PRFixture.load(args.fixtures) if args.fixtures else PRFixture(args.provider, args.files)
+    transport = fixture_transport(fixture, args.provider_latency / 1000, args.llm_latency / 1000)
+    create_client = http_client.create_client
+    # Provider and OpenAI clients are all created through create_client
+    http_client.create_client = lambda **kwargs: create_client(transport=transport, **kwargs)
+    return fixture.pr_url
+
+
+async def run_cli(args, pr_url: Callable[[int], str]) -> Dict[str, Any]:
+    from cli import PRReviewCLI
+
+    records = os.path.join(os.environ["BENCH_DIR"], "batch.ndjson")
+    urls = [pr_url(number) for number in range(1, args.reviews + 1)]
+    start = time.perf_counter()
+    failures = await PRReviewCLI().analyze_batch(urls, args.concurrency, records)
+    elapsed = time.perf_counter() - start
+    with open(records, encoding="utf-8") as f:
+        latencies = [record["latency_s"] for record in map(json.loads, f) if record["ok"]]
+    return summarize(latencies, failures, elapsed)
+
+
+async def run_fastapi(args, pr_url: Callable[[int], str]) -> Dict[str, Any]:
+    import httpx
+    from main import app
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def review(client: httpx.AsyncClient, number: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/analyze", json={"prUrl": pr_url(number)})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(review(client, number) for number in range(1, args.reviews + 1)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, failures, elapsed)
+
+
+def run_flask(args, pr_url: Callable[[int], str]) -> Dict[str, Any]:
+    from app import app
+
+    numbers = iter(range(1, args.reviews + 1))
+    numbers_lock = threading.Lock()
+    latencies: List[float] = []
+    failures = 0
+
+    def client_thread() -> None:
+        nonlocal failures
+        client = app.test_client()
+        while True:
+            with numbers_lock:
+                number = next(numbers, None)
+            if number is None:
+                return
+            response = client.post("/analyze", json={"prUrl": pr_url(number)})
+            if response.status_code != 202:
+                failures += 1
+                continue
+            job_id = response.get_json()["job_id"]
+            while True:
+                status = client.get(f"/status/{job_id}").get_json()
+                if status["finished_at"] is not None:
+                    break
+                time.sleep(FLASK_POLL_SECONDS)
+            if status["status"] == "completed":
+                # Timed by the server, so the polling interval does not count
+                latencies.append(status["finished_at"] - status["created_at"])
+            else:
+                failures += 1
+
+    threads = [threading.Thread(target=client_thread) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, failures, time.perf_counter() - start)
+
+
+def run_target(args) -> Dict[str, Any]:
+    """Benchmark one target in this process; its state lives in a throwaway directory"""
+    directory = tempfile.mkdtemp(prefix="pr-review-bench-")
+    os.environ.update({
+        "BENCH_DIR": directory,
+        "OPENAI_API_KEY": "bench",
+        "BITBUCKET_USERNAME": "bench",
+        "REVIEW_CACHE_PATH": os.path.join(directory, "review_cache.db"),
+        "HTTP_CACHE_DIR": os.path.join(directory, "http_cache"),
+        "HISTORY_DB_PATH": os.path.join(directory, "history.db"),
+        "WORK_QUEUE_PATH": os.path.join(directory, "work_queue.db"),
+        # Every review is let in; the benchmark bounds concurrency itself
+        "JOB_WORKERS": str(args.concurrency),
+        "JOB_QUEUE_DEPTH": str(args.reviews),
+    })
+    os.environ.pop("TRACE_EXPORT_PATH", None)
+    # The FastAPI app writes feedback.json to the working directory
+    os.chdir(directory)
+    try:
+        pr_url = install_fixtures(args)
+        if args.target == "flask":
+            return run_flask(args, pr_url)
+        if args.target == "fastapi":
+            return asyncio.run(run_fastapi(args, pr_url))
+        return asyncio.run(run_cli(args, pr_url))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help=f"Comma-separated targets to run (default {','.join(TARGETS)})")
+    parser.add_argument("--provider", choices=("github", "gitlab", "bitbucket"), default="github",
+                        help="Provider the PRs come from (default github)")
+    parser.add_argument("--files", type=int, default=20, help="Changed files per PR, 1 to 5000 (default 20)")
+    parser.add_argument("--fixtures", help="Directory of recorded responses (see fixtures.py) instead of synthetic ones")
+    parser.add_argument("--reviews", type=int, default=20, help="Reviews per target (default 20)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Reviews in flight at once (default 4)")
+    parser.add_argument("--provider-latency", type=float, default=50, help="Milliseconds per provider call (default 50)")
+    parser.add_argument("--llm-latency", type=float, default=500, help="Milliseconds per completion (default 500)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--target", choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not 1 <= args.files <= 5000:
+        parser.error("--files must be between 1 and 5000")
+
+    if args.target:
+        # Child process: benchmark one target and hand the result back on stdout
+        result = run_target(args)
+        print(json.dumps(result))
+        return
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"Unknown target: {target}")
+    forwarded = [
+        "--provider", args.provider, "--files", str(args.files), "--reviews", str(args.reviews),
+        "--concurrency", str(args.concurrency), "--provider-latency", str(args.provider_latency),
+        "--llm-latency", str(args.llm_latency),
+    ] + (["--fixtures", os.path.abspath(args.fixtures)] if args.fixtures else [])
+
+    results = {}
+    for target in targets:
+        print(f"⏱️  {target}...", file=sys.stderr)
+        child = subprocess.run(
+            [sys.executable, __file__, "--target", target] + forwarded,
+            cwd=BACKEND, capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            results[target] = {"error": (child.stderr.strip().splitlines() or [f"exit status {child.returncode}"])[-1]}
+            continue
+        results[target] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    report = json.dumps({
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "parameters": {
+            "provider": args.provider,
+            "files": args.files,
+            "fixtures": args.fixtures,
+            "reviews": args.reviews,
+            "concurrency": args.concurrency,
+            "provider_latency_ms": args.provider_latency,
+            "llm_latency_ms": args.llm_latency,
+        },
+        "results": results,
+    }, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
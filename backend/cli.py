@@ -6,14 +6,17 @@ import argparse
 import asyncio
 import json
 import sys
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 import os
 
 # Import our services
 from services.pr_analyzer import PRAnalyzer
-from services.git_providers import GitProviderFactory
-from models.feedback import ReviewFeedback
+from services.history_store import HistoryStore
+from services.http_client import aclose_clients
+from services.review_pipeline import review_pr
+from models.feedback import ReviewFeedback, TokenUsage
 
 # Load environment variables
 load_dotenv()
@@ -26,16 +29,10 @@ class PRReviewCLI:
         """Analyze a PR and output results"""
         try:
             print(f"🔍 Analyzing PR: {pr_url}")
-            print("⏳ Fetching PR data...")
+            print("⏳ Fetching PR data and running AI analysis...")
             
-            # Get provider and PR data
-            provider = GitProviderFactory.get_provider(pr_url)
-            pr_data = await provider.get_pr_data(pr_url)
-            
-            print("🤖 Running AI analysis...")
-            
-            # Analyze the PR
-            feedback = await self.analyzer.analyze_pr(pr_data)
+            # Get provider and PR data, then analyze the PR
+            pr_data, feedback = await review_pr(pr_url, self.analyzer)
             
             # Output results
             if output_format == 'json':
@@ -49,6 +46,75 @@ class PRReviewCLI:
             print(f"❌ Error: {str(e)}", file=sys.stderr)
             sys.exit(1)
     
+    async def analyze_batch(self, pr_urls, concurrency=4, output_file=None):
+        """Analyze many PRs in this process, writing one NDJSON record per PR as it completes"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def review_one(pr_url):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    pr_data, feedback = await review_pr(pr_url, self.analyzer)
+                    record = {
+                        "pr_url": pr_url,
+                        "ok": True,
+                        "title": pr_data.title,
+                        "author": pr_data.author,
+                        "feedback": feedback.model_dump()
+                    }
+                except Exception as e:
+                    # A failing PR only affects its own record
+                    record = {"pr_url": pr_url, "ok": False, "error": str(e)}
+                record["latency_s"] = round(time.perf_counter() - start, 3)
+                return record
+        
+        out = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+        latencies = []
+        failures = 0
+        usage = TokenUsage(exact=True)
+        start = time.perf_counter()
+        try:
+            for next_record in asyncio.as_completed([review_one(pr_url) for pr_url in pr_urls]):
+                record = await next_record
+                latencies.append(record["latency_s"])
+                failures += not record["ok"]
+                if record["ok"] and record["feedback"].get("usage"):
+                    usage += TokenUsage(**record["feedback"]["usage"])
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+        finally:
+            if output_file:
+                out.close()
+            await aclose_clients()
+        
+        self._print_batch_summary(len(pr_urls), failures, latencies, time.perf_counter() - start, usage)
+        return failures
+    
+    def _print_batch_summary(self, total, failures, latencies, elapsed, usage=None):
+        """Print throughput and latency of a batch run to stderr"""
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            ordered = sorted(latencies)
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+        
+        print("📈 BATCH SUMMARY", file=sys.stderr)
+        print("-" * 40, file=sys.stderr)
+        print(f"✅ Succeeded: {total - failures}/{total}", file=sys.stderr)
+        print(f"❌ Failed: {failures}", file=sys.stderr)
+        print(f"⏱️  Wall time: {elapsed:.2f}s", file=sys.stderr)
+        print(f"🚀 Throughput: {total / elapsed if elapsed else 0:.2f} reviews/s", file=sys.stderr)
+        print(
+            f"📊 Latency: p50 {percentile(50):.2f}s | p95 {percentile(95):.2f}s | max {max(latencies, default=0):.2f}s",
+            file=sys.stderr
+        )
+        if usage is not None:
+            print(
+                f"🪙 Tokens: {usage.prompt_tokens} prompt + {usage.completion_tokens} completion "
+                f"in {usage.calls} calls{'' if usage.exact else ' (estimated)'}",
+                file=sys.stderr
+            )
+    
     def _output_text(self, feedback, pr_data, output_file=None):
         """Output results in human-readable text format"""
         output = []
@@ -115,7 +181,16 @@ class PRReviewCLI:
         output.append(f"🔴 Errors: {error_count}")
         output.append(f"🟡 Warnings: {warning_count}")
         output.append(f"🔵 Info: {info_count}")
-        output.append(f"📁 Files Changed: {len(pr_data.files_changed)}")
+        output.append(f"📁 Files Changed: {len(pr_data.files_changed) or len(pr_data.parsed_diff.files)}")
+        output.append(f"➕ Lines Added: {pr_data.parsed_diff.additions}")
+        output.append(f"➖ Lines Removed: {pr_data.parsed_diff.deletions}")
+        if feedback.usage is not None:
+            output.append(
+                f"🪙 Tokens: {feedback.usage.prompt_tokens} prompt + {feedback.usage.completion_tokens} completion "
+                f"in {feedback.usage.calls} calls{'' if feedback.usage.exact else ' (estimated)'}"
+            )
+            if feedback.usage.skipped_hunks:
+                output.append(f"⏭️  Hunks not reviewed (call cap): {feedback.usage.skipped_hunks}")
         output.append("")
         
         output.append("=" * 80)
@@ -147,26 +222,19 @@ class PRReviewCLI:
         else:
             print(json_output)
     
-    def list_history(self):
+    def list_history(self, author=None, limit=10):
         """List analysis history"""
-        history_file = "analysis_history.json"
-        
-        if not os.path.exists(history_file):
-            print("📭 No analysis history found.")
-            return
-        
         try:
-            with open(history_file, 'r') as f:
-                history = json.load(f)
+            history, total = HistoryStore().query(per_page=limit, author=author)
             
             if not history:
                 print("📭 No analysis history found.")
                 return
             
-            print("📚 ANALYSIS HISTORY")
+            print(f"📚 ANALYSIS HISTORY (showing {len(history)} of {total})")
             print("=" * 80)
             
-            for i, entry in enumerate(history[:10], 1):  # Show last 10
+            for i, entry in enumerate(history, 1):
                 score_emoji = "🟢" if entry['score'] >= 80 else "🟡" if entry['score'] >= 60 else "🔴"
                 print(f"{i}. {score_emoji} {entry['score']}/100 - {entry['pr_title']}")
                 print(f"   👤 {entry['author']} | 📅 {entry['timestamp']} | 🐛 {entry['issues_count']} issues")
@@ -175,6 +243,11 @@ class PRReviewCLI:
                 
         except Exception as e:
             print(f"❌ Error reading history: {e}")
+    
+    def compact_history(self, keep_latest=None, older_than_days=None):
+        """Delete old history entries and reclaim disk space"""
+        deleted = HistoryStore().compact(keep_latest=keep_latest, older_than_days=older_than_days)
+        print(f"🧹 Removed {deleted} history entries")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -185,7 +258,10 @@ Examples:
   %(prog)s https://github.com/owner/repo/pull/123
   %(prog)s https://github.com/owner/repo/pull/123 --format json
   %(prog)s https://github.com/owner/repo/pull/123 --output report.txt
-  %(prog)s --history
+  %(prog)s --batch urls.txt --concurrency 8 --output results.ndjson
+  cat urls.txt | %(prog)s --batch - > results.ndjson
+  %(prog)s --history --author octocat --limit 20
+  %(prog)s --compact-history --keep 1000
         """
     )
     
@@ -193,8 +269,20 @@ Examples:
     parser.add_argument('--format', choices=['text', 'json'], default='text',
                        help='Output format (default: text)')
     parser.add_argument('--output', '-o', help='Output file path')
+    parser.add_argument('--batch', metavar='FILE',
+                       help='Review every PR URL in FILE (one per line, "-" for stdin) and write NDJSON results')
+    parser.add_argument('--concurrency', type=int, default=4,
+                       help='PRs reviewed at once in batch mode (default: 4)')
     parser.add_argument('--history', action='store_true',
                        help='Show analysis history')
+    parser.add_argument('--author', help='Only show history entries by this author')
+    parser.add_argument('--limit', type=int, default=10,
+                       help='Number of history entries to show (default: 10)')
+    parser.add_argument('--compact-history', action='store_true',
+                       help='Delete old history entries (see --keep and --older-than)')
+    parser.add_argument('--keep', type=int, help='Keep only the newest N history entries')
+    parser.add_argument('--older-than', type=float, metavar='DAYS',
+                       help='Delete history entries older than DAYS')
     
     args = parser.parse_args()
     
@@ -207,7 +295,15 @@ Examples:
     cli = PRReviewCLI()
     
     if args.history:
-        cli.list_history()
+        cli.list_history(args.author, args.limit)
+    elif args.compact_history:
+        cli.compact_history(args.keep, args.older_than)
+    elif args.batch:
+        source = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        with source:
+            pr_urls = [line.strip() for line in source if line.strip() and not line.lstrip().startswith('#')]
+        failures = asyncio.run(cli.analyze_batch(pr_urls, max(args.concurrency, 1), args.output))
+        sys.exit(1 if failures else 0)
     elif args.pr_url:
         asyncio.run(cli.analyze_pr(args.pr_url, args.format, args.output))
     else:
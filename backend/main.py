@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
@@ -8,7 +9,13 @@ import asyncio
 from datetime import datetime
 
 from services.pr_analyzer import PRAnalyzer
-from services.git_providers import GitProviderFactory
+from services.events import TERMINAL_EVENTS, format_sse
+from services.git_providers import rate_limiter, response_cache
+from services.http_client import aclose_clients
+from services.review_pipeline import review_pr
+from services.telemetry import METRICS_CONTENT_TYPE, gauge_from, registry
+from services.webhooks import WebhookError, parse_webhook
+from services.work_queue import WorkQueue
 from models.feedback import ReviewFeedback
 
 load_dotenv()
@@ -30,18 +37,38 @@ class PRRequest(BaseModel):
 # Global analyzer instance
 analyzer = PRAnalyzer()
 
+# Durable review queue fed by webhooks and drained by worker.py
+work_queue = WorkQueue()
+
+# Set by start.py --production: /analyze is then queued for the worker.py
+# pool instead of running in this HTTP worker
+ANALYZE_ON_QUEUE = os.getenv("ANALYZE_ON_QUEUE") == "1"
+ANALYZE_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_TIMEOUT_SECONDS", "600"))
+
+# Read when /metrics is scraped
+gauge_from("pr_review_queue_jobs", "Webhook review jobs by status",
+           lambda: {(status,): count for status, count in work_queue.stats().items() if status != "oldest_queued_seconds"},
+           ("status",))
+gauge_from("pr_review_queue_oldest_seconds", "Age of the oldest queued webhook review",
+           lambda: work_queue.stats()["oldest_queued_seconds"])
+gauge_from("pr_review_cache_hit_ratio", "Hit ratio of the review and provider HTTP caches",
+           lambda: {("review",): analyzer.cache.stats()["hit_ratio"], ("http",): response_cache.stats()["hit_ratio"]},
+           ("cache",))
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Close the pooled git provider connections"""
+    await aclose_clients()
+
 @app.post("/analyze")
 async def analyze_pr(request: PRRequest):
     """Analyze a pull request and generate feedback"""
     try:
-        # Parse PR URL to determine provider
-        provider = GitProviderFactory.get_provider(request.prUrl)
-        
-        # Get PR data
-        pr_data = await provider.get_pr_data(request.prUrl)
-        
-        # Analyze the PR
-        feedback = await analyzer.analyze_pr(pr_data)
+        # Fetch and analyze the PR
+        if ANALYZE_ON_QUEUE:
+            feedback = await review_on_queue(request.prUrl)
+        else:
+            pr_data, feedback = await review_pr(request.prUrl, analyzer)
         
         # Save feedback to file for frontend polling
         with open("feedback.json", "w") as f:
@@ -49,9 +76,73 @@ async def analyze_pr(request: PRRequest):
         
         return {"message": "PR analysis completed", "feedback": feedback}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def review_on_queue(pr_url: str) -> ReviewFeedback:
+    """Queue a review for the worker pool and wait for its feedback"""
+    job_id = work_queue.enqueue(pr_url, "api")
+    job = await work_queue.wait(job_id, ANALYZE_TIMEOUT_SECONDS)
+    if job is None:
+        raise HTTPException(status_code=504, detail=f"Review {job_id} is still queued or running")
+    if job["status"] != "done" or job["result"] is None:
+        raise HTTPException(status_code=500, detail=job["error"] or f"Review {job_id} {job['status']}")
+    return ReviewFeedback.model_validate_json(job["result"])
+
+@app.get("/analyze/stream")
+async def analyze_pr_stream(prUrl: str):
+    """Analyze a pull request, streaming its progress as Server-Sent Events.
+    
+    Always runs in this HTTP worker, even in production mode: the progress
+    and model tokens are streamed from the review as it happens.
+    """
+    events = asyncio.Queue()
+    task = asyncio.create_task(
+        review_pr(prUrl, analyzer, lambda event, data: events.put_nowait((event, data)))
+    )
+    
+    async def generate():
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+                if event in TERMINAL_EVENTS:
+                    break
+        finally:
+            # Stop the review if the client went away early
+            if not task.done():
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/webhooks/{provider}", status_code=202)
+async def receive_webhook(provider: str, request: Request):
+    """Verify a GitHub, GitLab or Bitbucket webhook and queue a review of its PR"""
+    body = await request.body()
+    try:
+        delivery = parse_webhook(provider, request.headers, body)
+    except WebhookError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if delivery is None:
+        return {"message": "Event ignored"}
+    job_id = work_queue.enqueue(delivery.pr_url, provider, delivery.head_sha, delivery.delivery_id)
+    if job_id is None:
+        return {"message": "Duplicate delivery"}
+    return {"message": "Review queued", "job_id": job_id}
+
 @app.get("/feedback")
 async def get_feedback():
     """Get the latest feedback if available"""
@@ -70,7 +161,21 @@ async def get_feedback():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "pid": os.getpid(),
+        "review_cache": analyzer.cache.stats(),
+        "http_cache": response_cache.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "work_queue": work_queue.stats(),
+        "review_workers": work_queue.workers()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this process"""
+    return Response(registry.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
 
 if __name__ == "__main__":
     import uvicorn
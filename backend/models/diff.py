@@ -0,0 +1,235 @@
+"""
+Structured view of a unified diff: files, hunks and line ranges as offsets into one buffer
+"""
+import hashlib
+import itertools
+import mmap
+import re
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+# Every line that starts a file, a hunk or a file's old/new path. Anchoring on
+# a literal newline rather than `^` lets the regex engine skip ahead with a
+# fast search; the first line of the buffer is matched on its own.
+_MARKER = (
+    rb'(?:diff --git a/(.*?) b/([^\r\n]*)'
+    rb'|@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@'
+    rb'|--- (?:a/)?([^\r\n]*)'
+    rb'|\+\+\+ (?:b/)?([^\r\n]*))'
+)
+_FIRST_MARKER = re.compile(_MARKER)
+_MARKERS = re.compile(rb'\n' + _MARKER)
+
+_DEV_NULL = b"/dev/null"
+
+# Block size for hashing large buffers without copying them whole
+_DIGEST_BLOCK = 1024 * 1024
+
+
+class Hunk:
+    """One `@@` hunk: its byte range and the line ranges it covers"""
+
+    __slots__ = ("start", "end", "body", "old_start", "old_count", "new_start", "new_count", "additions", "deletions")
+
+    def __init__(self, start: int, body: int, old_start: int, old_count: int, new_start: int, new_count: int):
+        self.start = start
+        self.body = body
+        self.end = body
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.additions = 0
+        self.deletions = 0
+
+
+class FileDiff:
+    """The header and hunks of one file; `path` is None only for bare hunks"""
+
+    __slots__ = ("path", "old_path", "added", "deleted", "start", "header_end", "end", "hunks")
+
+    def __init__(self, start: int, path: Optional[str] = None, old_path: Optional[str] = None):
+        self.path = path
+        self.old_path = old_path if old_path is not None else path
+        self.added = False
+        self.deleted = False
+        self.start = start
+        self.header_end = start
+        self.end = start
+        self.hunks: List[Hunk] = []
+
+    @property
+    def additions(self) -> int:
+        return sum(hunk.additions for hunk in self.hunks)
+
+    @property
+    def deletions(self) -> int:
+        return sum(hunk.deletions for hunk in self.hunks)
+
+    def remap_line(self, line: int) -> Optional[int]:
+        """Map a line of the old file to the new one; None if a hunk changed it"""
+        offset = 0
+        for hunk in self.hunks:
+            # A zero count means the hunk sits *after* the given line
+            old_begin = hunk.old_start if hunk.old_count else hunk.old_start + 1
+            if line < old_begin:
+                break
+            if line < old_begin + hunk.old_count:
+                return None
+            new_end = hunk.new_start + hunk.new_count if hunk.new_count else hunk.new_start + 1
+            offset = new_end - (old_begin + hunk.old_count)
+        return line + offset
+
+
+def _counter(buffer) -> Callable[[bytes, int, int], int]:
+    """`count(needle, start, end)` over the buffer; an mmap has no count of its own"""
+    count = getattr(buffer, "count", None)
+    if count is not None:
+        return count
+    return lambda needle, start, end: bytes(buffer[start:end]).count(needle)
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", "replace")
+
+
+class Diff:
+    """A parsed unified diff.
+
+    Files and hunks only record byte offsets into the shared `buffer`, so
+    the parse itself copies no diff text; text is decoded on demand. The
+    buffer is `bytes` or, for diffs spooled to disk, a read-only mmap.
+    """
+
+    def __init__(self, buffer, source: Optional[BinaryIO] = None):
+        self.buffer = buffer
+        # Keeps the file behind an mmap'ed buffer open
+        self.source = source
+        self.files = self._parse()
+
+    @classmethod
+    def from_text(cls, text: str) -> "Diff":
+        return cls(text.encode("utf-8", "surrogateescape"))
+
+    @classmethod
+    def from_file(cls, file: BinaryIO, read_limit: int = 0) -> "Diff":
+        """Parse a downloaded diff in place.
+
+        Files of at most `read_limit` bytes, such as a SpooledTemporaryFile
+        that stayed in memory, are read into `bytes`; larger ones are
+        memory-mapped rather than read.
+        """
+        size = file.seek(0, 2)
+        if size == 0:
+            return cls(b"", file)
+        if size <= read_limit:
+            file.seek(0)
+            return cls(file.read(), file)
+        return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), file)
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def __iter__(self) -> Iterator[FileDiff]:
+        return iter(self.files)
+
+    @property
+    def additions(self) -> int:
+        return sum(file_diff.additions for file_diff in self.files)
+
+    @property
+    def deletions(self) -> int:
+        return sum(file_diff.deletions for file_diff in self.files)
+
+    def digest(self) -> str:
+        """SHA-256 of the raw diff"""
+        digest = hashlib.sha256()
+        view = memoryview(self.buffer)
+        for offset in range(0, len(view), _DIGEST_BLOCK):
+            digest.update(view[offset:offset + _DIGEST_BLOCK])
+        return digest.hexdigest()
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """Decoded text between two offsets, without the trailing newline"""
+        end = len(self.buffer) if end is None else end
+        return _decode(bytes(self.buffer[start:end])).rstrip("\r\n")
+
+    def header(self, file_diff: FileDiff) -> str:
+        return self.text(file_diff.start, file_diff.header_end)
+
+    def hunk_text(self, hunk: Hunk) -> str:
+        return self.text(hunk.start, hunk.end)
+
+    def _parse(self) -> List[FileDiff]:
+        buffer = self.buffer
+        count = _counter(buffer)
+        files: List[FileDiff] = []
+        current: Optional[FileDiff] = None
+        hunk: Optional[Hunk] = None
+
+        def close(position: int) -> None:
+            if hunk is not None:
+                hunk.end = position
+                hunk.additions = count(b"\n+", hunk.body, position)
+                hunk.deletions = count(b"\n-", hunk.body, position)
+            if current is not None:
+                current.end = position
+                if not current.hunks:
+                    current.header_end = position
+
+        def hunk_complete(position: int) -> bool:
+            # Inside a hunk `---` may just be a removed line starting with
+            # `--`; it only names a new file once the hunk has all its lines
+            context = count(b"\n ", hunk.body, position)
+            return (
+                count(b"\n-", hunk.body, position) + context >= hunk.old_count
+                and count(b"\n+", hunk.body, position) + context >= hunk.new_count
+            )
+
+        first = _FIRST_MARKER.match(buffer)
+        for match in itertools.chain([first] if first else [], _MARKERS.finditer(buffer)):
+            old_git, new_git, old_start, old_count, new_start, new_count, old_path, new_path = match.groups()
+            position = match.start() if match is first else match.start() + 1
+            if new_git is not None:
+                close(position)
+                current = FileDiff(position, _decode(new_git), _decode(old_git))
+                files.append(current)
+                hunk = None
+            elif new_start is not None:
+                close(position)
+                if current is None:
+                    # Bare hunks without a file header
+                    current = FileDiff(position)
+                    files.append(current)
+                if not current.hunks:
+                    current.header_end = position
+                line_end = buffer.find(b"\n", match.end())
+                hunk = Hunk(
+                    position,
+                    line_end if line_end != -1 else len(buffer),
+                    int(old_start),
+                    int(old_count) if old_count is not None else 1,
+                    int(new_start),
+                    int(new_count) if new_count is not None else 1,
+                )
+                current.hunks.append(hunk)
+            elif hunk is None or (old_path is not None and hunk_complete(position)):
+                # `---`/`+++` name paths in a file header; in a plain diff
+                # without `diff --git` lines a `---` after a finished hunk
+                # starts the next file. /dev/null on either side marks an
+                # added or deleted file
+                if hunk is not None or current is None:
+                    close(position)
+                    current = FileDiff(position)
+                    files.append(current)
+                    hunk = None
+                if old_path is not None:
+                    if old_path == _DEV_NULL:
+                        current.added = True
+                    else:
+                        current.old_path = _decode(old_path)
+                elif new_path == _DEV_NULL:
+                    current.deleted = True
+                else:
+                    current.path = _decode(new_path)
+        close(len(buffer))
+        return files
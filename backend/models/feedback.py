@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+import asyncio
+from pydantic import BaseModel, PrivateAttr
+from typing import AsyncIterator, Iterable, List, Optional, Literal, Set
+
+from models.diff import Diff
 
 class Issue(BaseModel):
     type: Literal["error", "warning", "info"]
@@ -8,17 +11,113 @@ class Issue(BaseModel):
     message: str
     suggestion: Optional[str] = None
 
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    calls: int = 0
+    skipped_hunks: int = 0  # left out because of the per-review call cap
+    exact: bool = False  # counted by the API or the model's tokenizer, not estimated
+    
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            total_tokens=self.total_tokens + other.total_tokens,
+            calls=self.calls + other.calls,
+            skipped_hunks=self.skipped_hunks + other.skipped_hunks,
+            exact=self.exact and other.exact
+        )
+
 class ReviewFeedback(BaseModel):
     summary: str
     issues: List[Issue]
     score: int  # 0-100
     recommendations: List[str]
+    usage: Optional[TokenUsage] = None
+
+class FileListing:
+    """A PR's changed files, appended to `files` page by page as they arrive.
+    
+    `wait_for` returns as soon as the given paths are listed, so the review
+    of early files need not wait for the last page.
+    """
+    
+    def __init__(self, stream: AsyncIterator[dict], files: List[dict], total: Optional[int] = None):
+        self.files = files
+        self.total = total
+        self._paths: Set[str] = set()
+        self._update = asyncio.Event()
+        self._task = asyncio.ensure_future(self._fill(stream))
+    
+    async def _fill(self, stream: AsyncIterator[dict]) -> None:
+        try:
+            async for file_data in stream:
+                self.files.append(file_data)
+                self._paths.add(file_data.get("filename"))
+                self._update.set()
+                self._update = asyncio.Event()
+        finally:
+            self._update.set()
+    
+    async def wait_for(self, paths: Optional[Iterable[str]] = None) -> None:
+        """Wait until `paths` are listed, or for the whole listing; raises if fetching it failed"""
+        wanted = None if paths is None else set(paths)
+        while wanted is None or not wanted <= self._paths:
+            if self._task.done():
+                if not self._task.cancelled() and self._task.exception() is not None:
+                    raise self._task.exception()
+                return
+            await self._update.wait()
+    
+    def close(self) -> None:
+        """Stop fetching pages nobody will wait for"""
+        self._task.cancel()
 
 class PRData(BaseModel):
     title: str
     description: str
     files_changed: List[dict]
-    diff: str
+    diff: str  # empty when the diff was downloaded straight into `parsed_diff`
     author: str
     url: str
-    provider: str
\ No newline at end of file
+    provider: str
+    repo: Optional[str] = None
+    number: Optional[int] = None
+    head_sha: Optional[str] = None
+    
+    _parsed_diff: Optional[Diff] = PrivateAttr(default=None)
+    _files: Optional[FileListing] = PrivateAttr(default=None)
+    
+    @property
+    def parsed_diff(self) -> Diff:
+        """Structured view of `diff`, parsed once on first use"""
+        if self._parsed_diff is None:
+            self._parsed_diff = Diff.from_text(self.diff)
+        return self._parsed_diff
+    
+    def with_parsed_diff(self, diff: Diff) -> "PRData":
+        """Attach an already parsed diff, e.g. one spooled to disk while downloading"""
+        self._parsed_diff = diff
+        return self
+    
+    def with_file_listing(self, stream: AsyncIterator[dict], total: Optional[int] = None) -> "PRData":
+        """Fill `files_changed` from `stream` in the background while the PR is reviewed"""
+        self._files = FileListing(stream, self.files_changed, total)
+        return self
+    
+    @property
+    def files_total(self) -> int:
+        """Number of changed files, even while the listing is still arriving"""
+        if self._files is not None and self._files.total is not None:
+            return self._files.total
+        return len(self.files_changed)
+    
+    async def wait_for_files(self, paths: Optional[Iterable[str]] = None) -> None:
+        """Wait until `paths`, or all changed files, are in `files_changed`"""
+        if self._files is not None:
+            await self._files.wait_for(paths)
+    
+    def close_files(self) -> None:
+        if self._files is not None:
+            self._files.close()
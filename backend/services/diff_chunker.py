@@ -0,0 +1,128 @@
+"""
+Split unified diffs into per-file, per-hunk segments packed into token-budgeted chunks
+"""
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from models.diff import Diff, FileDiff
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class DiffChunk:
+    """A group of file segments that is reviewed in a single model call.
+
+    Segments are byte ranges of the diff and only decoded when `text` is
+    built, so chunks stay small however large the diff is.
+    """
+
+    def __init__(self, diff: Optional[Diff] = None):
+        self.diff = diff
+        self.ranges: List[Tuple[int, int]] = []
+        self.files: List[str] = []
+        self.tokens = 0
+        self.hunks = 0
+        self.last_file: Optional[FileDiff] = None
+
+    def add(self, path: Optional[str], start: int, end: int, tokens: int) -> None:
+        self.ranges.append((start, end))
+        if path and path not in self.files:
+            self.files.append(path)
+        self.tokens += tokens
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.diff.text(start, end) for start, end in self.ranges)
+
+
+def _range_tokens(start: int, end: int) -> int:
+    return (end - start) // 4 + 1
+
+
+def _split_oversized(
+    diff: Diff,
+    start: int,
+    end: int,
+    max_tokens: int,
+    measure: Callable[[int, int], int],
+) -> List[Tuple[int, int, int]]:
+    """Split a hunk that alone exceeds the budget on line boundaries"""
+    pieces: List[Tuple[int, int, int]] = []
+    piece_start = position = start
+    size = 0
+    while position < end:
+        newline = diff.buffer.find(b"\n", position, end)
+        line_end = end if newline == -1 else newline
+        line_tokens = measure(position, line_end)
+        if position > piece_start and size + line_tokens > max_tokens:
+            pieces.append((piece_start, position - 1, size))
+            piece_start, size = position, 0
+        size += line_tokens
+        position = line_end + 1
+    pieces.append((piece_start, end, size))
+    return pieces
+
+
+def chunk_diff(
+    diff: Union[str, Diff],
+    max_tokens: int,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    risk: Optional[Callable[[Optional[str], int, int], float]] = None,
+) -> List[DiffChunk]:
+    """Pack the hunks of `diff` into chunks of at most roughly `max_tokens`.
+
+    Hunks are never cut in the middle unless a single hunk is larger than
+    the budget, and every chunk repeats a file's header before its hunks.
+    Segments are measured with `count_tokens` when given, otherwise
+    estimated from their size. With `risk`, hunks are packed highest risk
+    first instead of in diff order.
+    """
+    if isinstance(diff, str):
+        diff = Diff.from_text(diff)
+    if count_tokens is None:
+        measure = _range_tokens
+    else:
+        measure = lambda start, end: count_tokens(diff.text(start, end))
+
+    segments = []
+    for file_diff in diff.files:
+        hunks = [(hunk.start, hunk.end) for hunk in file_diff.hunks]
+        segments.extend((file_diff, start, end) for start, end in hunks or [(file_diff.header_end,) * 2])
+    if risk is not None:
+        segments.sort(key=lambda segment: risk(segment[0].path, segment[1], segment[2]), reverse=True)
+
+    chunks: List[DiffChunk] = []
+    chunk = DiffChunk(diff)
+    header_tokens: Dict[int, int] = {}
+
+    for file_diff, hunk_start, hunk_end in segments:
+        has_header = file_diff.header_end > file_diff.start
+        if id(file_diff) not in header_tokens:
+            header_tokens[id(file_diff)] = measure(file_diff.start, file_diff.header_end) if has_header else 0
+        file_header_tokens = header_tokens[id(file_diff)]
+        pieces = [(hunk_start, hunk_end, measure(hunk_start, hunk_end))]
+        if file_header_tokens + pieces[0][2] > max_tokens:
+            pieces = _split_oversized(diff, hunk_start, hunk_end, max(max_tokens - file_header_tokens, 1), measure)
+        for piece_start, piece_end, piece_tokens in pieces:
+            needs_header = chunk.last_file is not file_diff
+            cost = piece_tokens + (file_header_tokens if needs_header else 0)
+            if chunk.ranges and chunk.tokens + cost > max_tokens:
+                chunks.append(chunk)
+                chunk = DiffChunk(diff)
+                needs_header = True
+                cost = piece_tokens + file_header_tokens
+            if needs_header and has_header:
+                chunk.add(file_diff.path, file_diff.start, file_diff.header_end, file_header_tokens)
+                cost -= file_header_tokens
+            if piece_end > piece_start:
+                chunk.add(file_diff.path, piece_start, piece_end, cost)
+                chunk.hunks += 1
+            else:
+                chunk.tokens += cost
+            chunk.last_file = file_diff
+
+    if chunk.ranges:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,22 @@
+"""
+Progress events emitted while a review runs, and their Server-Sent Events encoding
+"""
+import json
+from typing import Any, Callable, Dict, Optional
+
+# Receives (event name, JSON-serialisable payload) as the review progresses
+ReviewEventHandler = Callable[[str, Dict[str, Any]], None]
+
+# Events after which no more events follow
+TERMINAL_EVENTS = ("feedback", "error")
+
+
+def emit(on_event: Optional[ReviewEventHandler], event: str, data: Dict[str, Any]) -> None:
+    """Send an event to `on_event` if anyone is listening"""
+    if on_event is not None:
+        on_event(event, data)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
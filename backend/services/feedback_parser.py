@@ -0,0 +1,255 @@
+"""
+Incremental parser of the model's review JSON: issues as they arrive, repair of truncated output
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models.feedback import Issue, ReviewFeedback
+
+# Characters that matter outside and inside strings; everything else is skipped in bulk
+_STRUCTURAL = re.compile(r'[{}\[\]",]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# Later `{` tried as the document start when the first one was prose
+MAX_CANDIDATES = 8
+
+
+class FeedbackParseError(ValueError):
+    """The response holds no usable review object"""
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "parent_key", "key", "expect_key")
+
+    def __init__(self, kind: str, start: int, parent_key: Optional[str]):
+        self.kind = kind
+        self.start = start
+        self.parent_key = parent_key  # key this container is the value of
+        self.key: Optional[str] = None  # objects: key of the value being read
+        self.expect_key = kind == "{"
+
+
+class FeedbackStreamParser:
+    """Consumes the model's answer piece by piece and builds the ReviewFeedback it holds.
+
+    Text before the first `{` and after its matching `}` (prose, code
+    fences) is ignored. Each element of the top-level `issues` array is
+    validated and passed to `on_issue` as soon as its object closes. If the
+    answer stops early, e.g. at `max_tokens`, `close` completes the open
+    strings and brackets, or cuts back to the last complete value, instead
+    of giving up.
+    """
+
+    def __init__(self, on_issue: Optional[Callable[[Issue], None]] = None):
+        self.on_issue = on_issue
+        self.text = ""
+        self.repaired = False
+        self.dropped = 0  # issues that did not fit the schema
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._string_start = 0
+        # Where the document can be cut and which brackets then close it
+        self._safe: Optional[Tuple[int, str]] = None
+
+    @property
+    def complete(self) -> bool:
+        return self._end is not None
+
+    def feed(self, text: str) -> None:
+        self.text += text
+        if self._end is None:
+            self._scan()
+
+    def _closers(self) -> str:
+        return "".join("}" if frame.kind == "{" else "]" for frame in reversed(self._stack))
+
+    def _scan(self) -> None:
+        text = self.text
+        pos = self._pos
+        stack = self._stack
+        while pos < len(text):
+            if self._start is None:
+                pos = text.find("{", pos)
+                if pos < 0:
+                    pos = len(text)
+                    break
+                self._start = pos
+                stack.append(_Frame("{", pos, None))
+                self._safe = (pos + 1, "}")
+                pos += 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = len(text)
+                    break
+                index = match.start()
+                if text[index] == "\\":
+                    if index + 1 >= len(text):
+                        # Wait for the escaped character
+                        pos = index
+                        break
+                    pos = index + 2
+                    continue
+                self._in_string = False
+                frame = stack[-1]
+                if frame.kind == "{" and frame.expect_key:
+                    try:
+                        frame.key = json.loads(text[self._string_start:index + 1])
+                    except ValueError:
+                        frame.key = None
+                    frame.expect_key = False
+                pos = index + 1
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            index = match.start()
+            char = text[index]
+            pos = index + 1
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in "{[":
+                parent = stack[-1]
+                stack.append(_Frame(char, index, parent.key if parent.kind == "{" else None))
+                self._safe = (index + 1, self._closers())
+            elif char in "}]":
+                frame = stack.pop()
+                if not stack:
+                    self._end = index + 1
+                    break
+                if (
+                    frame.kind == "{" and len(stack) == 2
+                    and stack[-1].kind == "[" and stack[-1].parent_key == "issues"
+                ):
+                    self._emit(text[frame.start:index + 1])
+                self._safe = (index + 1, self._closers())
+            else:  # ","
+                frame = stack[-1]
+                if frame.kind == "{":
+                    frame.expect_key = True
+                self._safe = (index, self._closers())
+        self._pos = pos
+
+    def _emit(self, source: str) -> None:
+        if self.on_issue is None:
+            return
+        try:
+            issue = _issue(json.loads(source))
+        except ValueError:
+            return
+        if issue is not None:
+            self.on_issue(issue)
+
+    def close(self) -> ReviewFeedback:
+        """The review the answer holds, repaired if it was cut short"""
+        return _feedback(self._document(), self)
+
+    def _document(self) -> Dict[str, Any]:
+        if self._start is None:
+            raise FeedbackParseError("No JSON object in the response")
+        text = self.text
+        if self._end is not None:
+            try:
+                return _object(json.loads(text[self._start:self._end]))
+            except ValueError as e:
+                return self._next_candidate(e)
+
+        # Cut short: first close what is open, then fall back to the last complete value
+        self.repaired = True
+        attempts = []
+        stack = self._stack
+        if len(stack) >= 3 and stack[1].kind == "[" and stack[1].parent_key == "issues":
+            # A half-written issue is worse than none: drop it, keep the rest
+            attempts.append(text[self._start:stack[2].start].rstrip().rstrip(",") + "]}")
+        elif not (self._in_string and stack[-1].expect_key):
+            attempts.append(text[self._start:] + ('"' if self._in_string else "") + self._closers())
+        if self._safe is not None:
+            index, closers = self._safe
+            attempts.append(text[self._start:index] + closers)
+        for attempt in attempts:
+            try:
+                return _object(json.loads(attempt))
+            except ValueError:
+                continue
+        return self._next_candidate(FeedbackParseError("Truncated response could not be repaired"))
+
+    def _next_candidate(self, error: Exception, depth: int = 0) -> Dict[str, Any]:
+        """Try the next `{`, in case the first one was part of prose"""
+        following = self.text.find("{", self._start + 1)
+        if following < 0 or depth >= MAX_CANDIDATES:
+            raise FeedbackParseError(str(error))
+        parser = FeedbackStreamParser()
+        parser.feed(self.text[following:])
+        try:
+            document = parser._document()
+        except FeedbackParseError as e:
+            return parser._next_candidate(e, depth + 1)
+        self.repaired = parser.repaired
+        return document
+
+
+def _object(value: Any) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise FeedbackParseError("The response is not a JSON object")
+    return value
+
+
+def _issue(data: Any) -> Optional[Issue]:
+    """An issue as the prompt describes it, or None if it does not fit the schema"""
+    if not isinstance(data, dict):
+        return None
+    line = data.get("line")
+    try:
+        line = int(line) if line is not None else None
+    except (TypeError, ValueError):
+        # e.g. "12-15": keep the issue, just without a line
+        line = None
+    try:
+        return Issue(
+            type=str(data.get("type") or "info").lower(),
+            file=data.get("file") or "unknown",
+            line=line,
+            message=data.get("message", ""),
+            suggestion=data.get("suggestion"),
+        )
+    except ValidationError:
+        return None
+
+
+def _feedback(data: Dict[str, Any], parser: FeedbackStreamParser) -> ReviewFeedback:
+    issues = []
+    for issue_data in data.get("issues") or []:
+        issue = _issue(issue_data)
+        if issue is None:
+            parser.dropped += 1
+        else:
+            issues.append(issue)
+    try:
+        score = int(data.get("score", 75))
+    except (TypeError, ValueError):
+        score = 75
+    summary = data.get("summary")
+    return ReviewFeedback(
+        summary=summary if isinstance(summary, str) and summary else "Analysis completed",
+        score=max(0, min(100, score)),
+        issues=issues,
+        recommendations=[item for item in data.get("recommendations") or [] if isinstance(item, str)],
+    )
+
+
+def parse_feedback(text: str) -> ReviewFeedback:
+    """Parse a complete answer in one go"""
+    parser = FeedbackStreamParser()
+    parser.feed(text)
+    return parser.close()
@@ -1,24 +1,140 @@
 import re
 import os
-import requests
+import math
+import hashlib
+import asyncio
+import tempfile
+import httpx
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, AsyncIterator, Awaitable, Tuple
 import base64
 from urllib.parse import urlparse
 
+from models.diff import Diff
 from models.feedback import PRData
+from services.http_cache import CachedResponse, ConditionalCache
+from services.http_client import get_client
+from services.rate_limiter import RateLimitScheduler
+from services.telemetry import provider_requests, span
+
+# Shared by all providers; 304 revalidations cost no rate-limit budget
+response_cache = ConditionalCache()
+rate_limiter = RateLimitScheduler()
+
+# How often a rate-limited request is retried once its budget frees up
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "2"))
+
+# Diffs larger than this are spooled to disk while downloading
+DIFF_SPOOL_MAX_BYTES = int(os.getenv("DIFF_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
 
 class GitProvider(ABC):
     """Abstract base class for git providers"""
     
+    name = "git"
+    headers: Dict[str, str] = {}
+    
     @abstractmethod
     async def get_pr_data(self, pr_url: str) -> PRData:
         """Get PR data from the provider"""
         pass
+    
+    async def get_compare_diff(self, pr_data: PRData, base_sha: str, head_sha: str) -> Diff:
+        """Unified diff of the PR's commits after `base_sha` up to `head_sha`"""
+        raise NotImplementedError(f"{self.name} does not support comparing commits")
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled keep-alive client shared by every instance of this provider"""
+        return get_client(self.name)
+    
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> httpx.Response:
+        """GET `url` with the provider's auth headers and raise on HTTP errors.
+        
+        Responses carrying an ETag or Last-Modified are kept on disk and the
+        next request for the same URL is sent conditionally; a 304 answer is
+        served from the stored copy. Calls are paced by the shared rate-limit
+        scheduler, and rate-limited calls are retried once budget frees up.
+        """
+        response, cache_key, cached = await self._send(url, headers, stream=False, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return await response_cache.replay(cached, response.request)
+        response.raise_for_status()
+        await response_cache.store(cache_key, response)
+        return response
+    
+    async def _download_diff(self, url: str, headers: Optional[Dict[str, str]] = None) -> Diff:
+        """Like `_get`, but stream the body into a spooled temporary file and parse it as a diff.
+        
+        Bodies beyond DIFF_SPOOL_MAX_BYTES go to disk and are parsed through
+        an mmap, so no diff is ever held in memory whole.
+        """
+        with span("download_diff", provider=self.name) as download:
+            response, cache_key, cached = await self._send(url, headers, stream=True)
+            spool = None
+            try:
+                try:
+                    if response.status_code == 304 and cached is not None:
+                        download.set(cached=True)
+                        spool = response_cache.open_body(cached)
+                        return Diff.from_file(spool)
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
+                    spool = tempfile.SpooledTemporaryFile(max_size=DIFF_SPOOL_MAX_BYTES)
+                    async for block in response.aiter_bytes():
+                        spool.write(block)
+                    download.set(cached=False, bytes=spool.tell())
+                finally:
+                    await response.aclose()
+                await response_cache.store(cache_key, response, spool)
+                return Diff.from_file(spool, read_limit=DIFF_SPOOL_MAX_BYTES)
+            except BaseException:
+                # The Diff owns the file once built; until then it is ours to close
+                if spool is not None:
+                    spool.close()
+                raise
+    
+    async def _send(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        **kwargs
+    ) -> Tuple[httpx.Response, str, Optional[CachedResponse]]:
+        """Send a conditional, rate-limited GET; returns the response and its cache entry"""
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+        
+        cache_key = response_cache.make_key(str(httpx.URL(url, params=kwargs.get("params"))), request_headers)
+        cached = response_cache.lookup(cache_key)
+        if cached is not None:
+            request_headers.update(cached.validators())
+        
+        # Budgets are tracked per token, identified by a hash of its header
+        token_key = hashlib.sha256(request_headers.get("Authorization", "").encode()).hexdigest()[:12]
+        with span("provider_request", provider=self.name, url=urlparse(url).path) as request_span:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await rate_limiter.acquire(self.name, token_key)
+                request = self.client.build_request("GET", url, headers=request_headers, **kwargs)
+                response = await self.client.send(request, stream=stream)
+                if not rate_limiter.update(self.name, token_key, response) or attempt == RATE_LIMIT_RETRIES:
+                    break
+                await response.aclose()
+            request_span.set(status_code=response.status_code, attempts=attempt + 1, revalidated=response.status_code == 304)
+        provider_requests.inc(provider=self.name, status=response.status_code)
+        return response, cache_key, cached
+
+# GitHub serves at most 100 files per page and 3000 files per PR
+FILES_PER_PAGE = 100
+MAX_FILES_PAGES = 30
 
 class GitHubProvider(GitProvider):
+    name = "github"
+    
     def __init__(self):
         self.token = os.getenv("GITHUB_TOKEN")
+        self.api_url = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
         self.headers = {
             "Authorization": f"token {self.token}",
             "Accept": "application/vnd.github.v3+json"
@@ -31,43 +147,98 @@ class GitHubProvider(GitProvider):
             raise ValueError("Invalid GitHub PR URL")
         
         owner, repo, pr_number = match.groups()
+        pr_api_url = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}"
         
-        # Get PR details
-        pr_response = requests.get(
-            f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}",
-            headers=self.headers
-        )
-        pr_response.raise_for_status()
-        pr_data = pr_response.json()
-        
-        # Get PR files
-        files_response = requests.get(
-            f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files",
-            headers=self.headers
-        )
-        files_response.raise_for_status()
-        files_data = files_response.json()
-        
-        # Get diff
-        diff_response = requests.get(
-            pr_data["diff_url"],
-            headers=self.headers
+        # PR details, the first page of files and the diff are independent, so
+        # fetch them concurrently. The diff comes from the API endpoint with the
+        # diff media type rather than `diff_url`, which would need the details first.
+        pr_task = asyncio.ensure_future(self._get(pr_api_url))
+        diff_task = asyncio.ensure_future(
+            self._download_diff(pr_api_url, headers={"Accept": "application/vnd.github.v3.diff"})
         )
-        diff_response.raise_for_status()
+        first_page_task = asyncio.ensure_future(self._get_files_page(pr_api_url, 1))
+        try:
+            pr_data = (await pr_task).json()
+            diff = await diff_task
+        except BaseException:
+            for task in (pr_task, diff_task, first_page_task):
+                task.cancel()
+            raise
         
+        # The review starts on the diff right away; file pages keep arriving
+        # into `files_changed` and each prompt waits only for its own files
         return PRData(
             title=pr_data["title"],
             description=pr_data["body"] or "",
-            files_changed=files_data,
-            diff=diff_response.text,
+            files_changed=[],
+            diff="",
             author=pr_data["user"]["login"],
             url=pr_url,
-            provider="github"
+            provider="github",
+            repo=f"{owner}/{repo}",
+            number=int(pr_number),
+            head_sha=pr_data["head"]["sha"]
+        ).with_parsed_diff(diff).with_file_listing(
+            self.iter_pr_files(pr_api_url, pr_data.get("changed_files"), first_page_task),
+            pr_data.get("changed_files")
+        )
+    
+    async def get_compare_diff(self, pr_data: PRData, base_sha: str, head_sha: str) -> Diff:
+        return await self._download_diff(
+            f"{self.api_url}/repos/{pr_data.repo}/compare/{base_sha}...{head_sha}",
+            headers={"Accept": "application/vnd.github.v3.diff"}
         )
+    
+    async def _get_files_page(self, pr_api_url: str, page: int) -> httpx.Response:
+        return await self._get(f"{pr_api_url}/files", params={"per_page": FILES_PER_PAGE, "page": page})
+    
+    async def iter_pr_files(
+        self,
+        pr_api_url: str,
+        changed_files: Optional[int] = None,
+        first_page: Optional[Awaitable[httpx.Response]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every changed file of a PR, page by page in order.
+        
+        When the PR's `changed_files` count is known all remaining pages are
+        requested at once; otherwise the `Link: rel="next"` headers are followed.
+        """
+        try:
+            response = await (first_page or self._get_files_page(pr_api_url, 1))
+        finally:
+            if first_page is not None and not first_page.done():
+                first_page.cancel()
+        for file_data in response.json():
+            yield file_data
+        
+        if changed_files is None:
+            next_url = response.links.get("next", {}).get("url")
+            while next_url:
+                response = await self._get(next_url)
+                for file_data in response.json():
+                    yield file_data
+                next_url = response.links.get("next", {}).get("url")
+            return
+        
+        pages = min(math.ceil(changed_files / FILES_PER_PAGE), MAX_FILES_PAGES)
+        tasks = [
+            asyncio.ensure_future(self._get_files_page(pr_api_url, page))
+            for page in range(2, pages + 1)
+        ]
+        try:
+            for task in tasks:
+                for file_data in (await task).json():
+                    yield file_data
+        finally:
+            for task in tasks:
+                task.cancel()
 
 class GitLabProvider(GitProvider):
+    name = "gitlab"
+    
     def __init__(self):
         self.token = os.getenv("GITLAB_TOKEN")
+        self.api_url = os.getenv("GITLAB_API_URL", "https://gitlab.com/api/v4").rstrip("/")
         self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
@@ -81,42 +252,58 @@ class GitLabProvider(GitProvider):
         
         owner, repo, mr_number = match.groups()
         project_path = f"{owner}/{repo}"
+        mr_api_url = f"{self.api_url}/projects/{project_path.replace('/', '%2F')}/merge_requests/{mr_number}"
         
-        # Get MR details
-        mr_response = requests.get(
-            f"https://gitlab.com/api/v4/projects/{project_path.replace('/', '%2F')}/merge_requests/{mr_number}",
-            headers=self.headers
+        # Get MR details and changes concurrently
+        mr_response, changes_response = await asyncio.gather(
+            self._get(mr_api_url),
+            self._get(f"{mr_api_url}/changes"),
         )
-        mr_response.raise_for_status()
         mr_data = mr_response.json()
-        
-        # Get MR changes
-        changes_response = requests.get(
-            f"https://gitlab.com/api/v4/projects/{project_path.replace('/', '%2F')}/merge_requests/{mr_number}/changes",
-            headers=self.headers
-        )
-        changes_response.raise_for_status()
         changes_data = changes_response.json()
         
-        # Build diff from changes
-        diff_parts = []
-        for change in changes_data.get("changes", []):
-            diff_parts.append(change.get("diff", ""))
-        
         return PRData(
             title=mr_data["title"],
             description=mr_data["description"] or "",
             files_changed=changes_data.get("changes", []),
-            diff="\n".join(diff_parts),
+            diff=self._build_diff(changes_data.get("changes", [])),
             author=mr_data["author"]["username"],
             url=pr_url,
-            provider="gitlab"
+            provider="gitlab",
+            repo=project_path,
+            number=int(mr_number),
+            head_sha=mr_data.get("sha")
+        )
+    
+    async def get_compare_diff(self, pr_data: PRData, base_sha: str, head_sha: str) -> Diff:
+        response = await self._get(
+            f"{self.api_url}/projects/{pr_data.repo.replace('/', '%2F')}/repository/compare",
+            params={"from": base_sha, "to": head_sha}
         )
+        return Diff.from_text(self._build_diff(response.json().get("diffs", [])))
+    
+    @staticmethod
+    def _build_diff(changes: List[Dict[str, Any]]) -> str:
+        """Build a unified diff from GitLab changes, which omit the per-file headers"""
+        diff_parts = []
+        for change in changes:
+            old_path = change.get("old_path", "")
+            new_path = change.get("new_path", old_path)
+            diff_parts.append(
+                f"diff --git a/{old_path} b/{new_path}\n"
+                f"--- {'/dev/null' if change.get('new_file') else 'a/' + old_path}\n"
+                f"+++ {'/dev/null' if change.get('deleted_file') else 'b/' + new_path}\n"
+                + change.get("diff", "")
+            )
+        return "\n".join(diff_parts)
 
 class BitbucketProvider(GitProvider):
+    name = "bitbucket"
+    
     def __init__(self):
         self.username = os.getenv("BITBUCKET_USERNAME", "dummy_user")
         self.password = os.getenv("BITBUCKET_APP_PASSWORD", "dummy_password")
+        self.api_url = os.getenv("BITBUCKET_API_URL", "https://api.bitbucket.org/2.0").rstrip("/")
         auth_string = f"{self.username}:{self.password}"
         encoded_auth = base64.b64encode(auth_string.encode()).decode()
         self.headers = {
@@ -153,29 +340,27 @@ class BitbucketProvider(GitProvider):
         
         # Real implementation would make API calls here
         try:
-            pr_response = requests.get(
-                f"https://api.bitbucket.org/2.0/repositories/{workspace}/{repo}/pullrequests/{pr_number}",
-                headers=self.headers
-            )
-            pr_response.raise_for_status()
-            pr_data = pr_response.json()
+            pr_api_url = f"{self.api_url}/repositories/{workspace}/{repo}/pullrequests/{pr_number}"
             
-            # Get diff
-            diff_response = requests.get(
-                f"https://api.bitbucket.org/2.0/repositories/{workspace}/{repo}/pullrequests/{pr_number}/diff",
-                headers=self.headers
+            # Get PR details and diff concurrently
+            pr_response, diff = await asyncio.gather(
+                self._get(pr_api_url),
+                self._download_diff(f"{pr_api_url}/diff"),
             )
-            diff_response.raise_for_status()
+            pr_data = pr_response.json()
             
             return PRData(
                 title=pr_data["title"],
                 description=pr_data["description"] or "",
                 files_changed=[],  # Bitbucket API structure differs
-                diff=diff_response.text,
+                diff="",
                 author=pr_data["author"]["username"],
                 url=pr_url,
-                provider="bitbucket"
-            )
+                provider="bitbucket",
+                repo=f"{workspace}/{repo}",
+                number=int(pr_number),
+                head_sha=pr_data.get("source", {}).get("commit", {}).get("hash")
+            ).with_parsed_diff(diff)
         except Exception:
             # Fallback to dummy data if API fails
             return PRData(
@@ -187,6 +372,12 @@ class BitbucketProvider(GitProvider):
                 url=pr_url,
                 provider="bitbucket"
             )
+    
+    async def get_compare_diff(self, pr_data: PRData, base_sha: str, head_sha: str) -> Diff:
+        # Bitbucket's spec compares the first commit against the second
+        return await self._download_diff(
+            f"{self.api_url}/repositories/{pr_data.repo}/diff/{head_sha}..{base_sha}"
+        )
 
 class GitProviderFactory:
     """Factory class to get the appropriate git provider"""
@@ -0,0 +1,146 @@
+"""
+Indexed SQLite store for the analysis history
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+LEGACY_HISTORY_FILE = "analysis_history.json"
+
+_COLUMNS = ("id", "timestamp", "pr_url", "pr_title", "author", "score", "issues_count", "summary")
+
+
+class HistoryStore:
+    """Append-only history of reviews in a WAL-mode SQLite database.
+
+    Every thread gets its own connection so readers never block the writer.
+    On first use the entries of the old `analysis_history.json` are imported.
+    """
+
+    def __init__(self, path: Optional[str] = None, legacy_json_path: str = LEGACY_HISTORY_FILE):
+        self.path = path or os.getenv("HISTORY_DB_PATH", "analysis_history.db")
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    pr_url TEXT NOT NULL,
+                    pr_title TEXT,
+                    author TEXT,
+                    score INTEGER,
+                    issues_count INTEGER,
+                    summary TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_pr_url ON history (pr_url);
+                CREATE INDEX IF NOT EXISTS idx_history_author ON history (author);
+                CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_history_score ON history (score);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+        self.import_legacy_json(legacy_json_path)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def import_legacy_json(self, json_path: str) -> int:
+        """Import a JSON history file once; returns the number of imported entries"""
+        if not os.path.exists(json_path):
+            return 0
+        conn = self._connection()
+        with conn:
+            # Marking the import first takes the write lock, so of several
+            # processes starting at once only one imports the file
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('legacy_json_imported', ?)",
+                (json_path,),
+            ).rowcount
+            if not claimed:
+                return 0
+            with open(json_path, 'r') as f:
+                entries = json.load(f)
+            # The JSON file is newest first; insert oldest first so ids follow time
+            conn.executemany(
+                "INSERT INTO history (timestamp, pr_url, pr_title, author, score, issues_count, summary) "
+                "VALUES (:timestamp, :pr_url, :pr_title, :author, :score, :issues_count, :summary)",
+                [
+                    {column: entry.get(column) for column in _COLUMNS[1:]}
+                    for entry in reversed(entries)
+                ],
+            )
+        return len(entries)
+
+    def add(self, entry: Dict[str, Any]) -> int:
+        """Record one review and return its id"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO history (timestamp, pr_url, pr_title, author, score, issues_count, summary) "
+                "VALUES (:timestamp, :pr_url, :pr_title, :author, :score, :issues_count, :summary)",
+                {column: entry.get(column) for column in _COLUMNS[1:]},
+            )
+        return cursor.lastrowid
+
+    def query(
+        self,
+        page: int = 1,
+        per_page: int = 20,
+        pr_url: Optional[str] = None,
+        author: Optional[str] = None,
+        min_score: Optional[int] = None,
+        max_score: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of entries, newest first, and the total number of matches"""
+        conditions, params = [], []
+        for clause, value in (
+            ("pr_url = ?", pr_url),
+            ("author = ?", author),
+            ("score >= ?", min_score),
+            ("score <= ?", max_score),
+            ("timestamp >= ?", since),
+            ("timestamp <= ?", until),
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        conn = self._connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM history {where} "
+            "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params + [per_page, (max(page, 1) - 1) * per_page],
+        ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows], total
+
+    def compact(self, keep_latest: Optional[int] = None, older_than_days: Optional[float] = None) -> int:
+        """Delete entries beyond the newest `keep_latest` or older than `older_than_days`, then reclaim space"""
+        conn = self._connection()
+        deleted = 0
+        with conn:
+            if older_than_days is not None:
+                cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - older_than_days * 86400))
+                deleted += conn.execute("DELETE FROM history WHERE timestamp < ?", (cutoff,)).rowcount
+            if keep_latest is not None:
+                deleted += conn.execute(
+                    "DELETE FROM history WHERE id NOT IN "
+                    "(SELECT id FROM history ORDER BY timestamp DESC, id DESC LIMIT ?)",
+                    (keep_latest,),
+                ).rowcount
+        if deleted:
+            conn.execute("VACUUM")
+        return deleted
@@ -0,0 +1,169 @@
+"""
+On-disk cache of provider API responses revalidated with ETag / Last-Modified
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Optional
+
+import aiofiles
+import httpx
+
+# Response headers that describe the wire encoding rather than the stored body
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+# Block size for copying streamed bodies into the cache
+_COPY_BLOCK = 1024 * 1024
+
+
+class CachedResponse:
+    """Metadata of a stored response; the body lives in a sibling file"""
+
+    def __init__(self, data: Dict[str, Any], body_path: str):
+        self.url = data["url"]
+        self.status_code = data["status_code"]
+        self.headers = data["headers"]
+        self.etag = data.get("etag")
+        self.last_modified = data.get("last_modified")
+        self.body_path = body_path
+
+    def validators(self) -> Dict[str, str]:
+        """Headers that turn the next request into a conditional one"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ConditionalCache:
+    """Stores responses that carry validators and replays them on 304 Not Modified.
+
+    Entries are keyed by URL, Accept header and a hash of the credentials, so
+    different media types and tokens never share an entry. Beyond `max_bytes`
+    the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.getenv("HTTP_CACHE_DIR", ".http_cache")
+        self.max_bytes = max_bytes or int(os.getenv("HTTP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    @staticmethod
+    def make_key(url: str, headers: Dict[str, str]) -> str:
+        lowered = {name.lower(): value for name, value in headers.items()}
+        credentials = hashlib.sha256(lowered.get("authorization", "").encode()).hexdigest()
+        return hashlib.sha256(
+            json.dumps([url, lowered.get("accept", ""), credentials]).encode()
+        ).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", f"{base}.body"
+
+    def lookup(self, key: str) -> Optional[CachedResponse]:
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                return CachedResponse(json.load(f), body_path)
+        except (OSError, ValueError):
+            return None
+
+    async def replay(self, entry: CachedResponse, request: httpx.Request) -> httpx.Response:
+        """Build a response from a stored entry after the server answered 304"""
+        async with aiofiles.open(entry.body_path, 'rb') as f:
+            body = await f.read()
+        now = time.time()
+        os.utime(entry.body_path, (now, now))
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(body)
+        return httpx.Response(entry.status_code, headers=entry.headers, content=body, request=request)
+
+    def open_body(self, entry: CachedResponse) -> BinaryIO:
+        """Open a stored body for reading after the server answered 304"""
+        body = open(entry.body_path, 'rb')
+        size = os.fstat(body.fileno()).st_size
+        now = time.time()
+        os.utime(entry.body_path, (now, now))
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += size
+        return body
+
+    async def store(self, key: str, response: httpx.Response, body: Optional[BinaryIO] = None) -> None:
+        """Keep a successful response if it can be revalidated later.
+
+        Streamed responses pass the file their `body` was spooled to.
+        """
+        with self._lock:
+            self.misses += 1
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not (etag or last_modified):
+            return
+
+        meta_path, body_path = self._paths(key)
+        meta = json.dumps({
+            "url": str(response.request.url),
+            "status_code": response.status_code,
+            "headers": {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in _DROPPED_HEADERS
+            },
+            "etag": etag,
+            "last_modified": last_modified,
+        })
+        previous = sum(os.path.getsize(path) for path in (meta_path, body_path) if os.path.exists(path))
+        # Write the body first so a metadata file never points at a missing body
+        async with aiofiles.open(body_path, 'wb') as f:
+            if body is None:
+                await f.write(response.content)
+                size = len(response.content)
+            else:
+                body.seek(0)
+                size = 0
+                for block in iter(lambda: body.read(_COPY_BLOCK), b""):
+                    await f.write(block)
+                    size += len(block)
+        async with aiofiles.open(meta_path, 'w') as f:
+            await f.write(meta)
+        with self._lock:
+            self._size += size + len(meta) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+    def _evict(self) -> None:
+        bodies = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".body")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for body in bodies:
+            if self._size <= self.max_bytes:
+                break
+            meta_path, body_path = self._paths(body.name[:-len(".body")])
+            for path in (meta_path, body_path):
+                try:
+                    self._size -= os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,62 @@
+"""
+Shared, connection-pooled async HTTP clients
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx when installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_TIMEOUT = httpx.Timeout(float(os.getenv("GIT_PROVIDER_TIMEOUT", "30")), connect=10.0)
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("GIT_PROVIDER_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("GIT_PROVIDER_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=60.0,
+)
+
+# httpx.AsyncClient is bound to the event loop it was first used on, so the
+# pools are kept per loop. FastAPI and the CLI run a single loop; the Flask
+# workers each keep their own loop alive, so keep-alive still spans many PRs.
+_loop_locals: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+_lock = threading.RLock()
+
+
+def get_loop_local(name: str, factory: Callable[[], Any]) -> Any:
+    """Return the object called `name` for the running event loop, creating it with `factory`"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        values = _loop_locals.setdefault(loop, {})
+        value = values.get(name)
+        if value is None or getattr(value, "is_closed", False) is True:
+            value = factory()
+            values[name] = value
+    return value
+
+
+def create_client(**kwargs) -> httpx.AsyncClient:
+    """Create a pooled client with the shared defaults"""
+    options = dict(http2=HTTP2_AVAILABLE, timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS, follow_redirects=True)
+    options.update(kwargs)
+    return httpx.AsyncClient(**options)
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Return the long-lived client called `name` for the running event loop"""
+    return get_loop_local(name, create_client)
+
+
+async def aclose_clients() -> None:
+    """Close every client owned by the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        values = _loop_locals.pop(loop, {})
+    closers = [value.aclose() for value in values.values() if hasattr(value, "aclose")]
+    await asyncio.gather(*closers, return_exceptions=True)
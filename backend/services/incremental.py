@@ -0,0 +1,32 @@
+"""
+Carry the issues of a previous review forward across the commits pushed since
+"""
+from typing import List
+
+from models.diff import Diff
+from models.feedback import Issue
+
+
+def carry_forward_issues(issues: List[Issue], compare_diff: Diff) -> List[Issue]:
+    """Keep the issues of a previous review that the new commits left alone.
+
+    Issues on lines a hunk touched are dropped, since those lines are
+    reviewed again; the others move with the lines around them and follow
+    renames. Issues on deleted files are dropped.
+    """
+    files = {file_diff.old_path: file_diff for file_diff in compare_diff.files if file_diff.old_path}
+    carried = []
+    for issue in issues:
+        file_diff = files.get(issue.file)
+        if file_diff is None:
+            carried.append(issue)
+            continue
+        if file_diff.deleted:
+            continue
+        line = issue.line
+        if line is not None:
+            line = file_diff.remap_line(line)
+            if line is None:
+                continue
+        carried.append(issue.model_copy(update={"file": file_diff.path, "line": line}))
+    return carried
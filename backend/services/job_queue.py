@@ -0,0 +1,154 @@
+"""
+Bounded background job queue for PR reviews
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.events import ReviewEventHandler
+
+
+class QueueFullError(Exception):
+    """Raised when the queue has no room for another job"""
+
+
+class Job:
+    """A single submitted review and its outcome"""
+
+    def __init__(self, job_id: str, pr_url: str, on_event: Optional[ReviewEventHandler] = None):
+        self.id = job_id
+        self.pr_url = pr_url
+        self.on_event = on_event
+        self.status = "queued"  # queued | processing | completed | failed
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "pr_url": self.pr_url,
+            "status": self.status,
+            "is_processing": not self.is_finished,
+            "has_feedback": self.status == "completed",
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs review jobs on a fixed pool of worker threads.
+
+    At most `workers` jobs run at once and at most `max_queued` more wait for
+    a worker; `submit` raises QueueFullError beyond that. Finished jobs are
+    kept for `ttl_seconds` and capped at `max_finished`, least recently
+    accessed first.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[Any]],
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_finished: Optional[int] = None,
+    ):
+        self.handler = handler
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv("JOB_QUEUE_DEPTH", "32"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("JOB_TTL_SECONDS", "3600"))
+        self.max_finished = max_finished if max_finished is not None else int(os.getenv("JOB_MAX_FINISHED", "200"))
+        self.latest_job_id: Optional[str] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="review-worker")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(self, pr_url: str, on_event: Optional[ReviewEventHandler] = None) -> Job:
+        """Queue a review of `pr_url` and return its job; `on_event` receives its progress"""
+        with self._lock:
+            self._evict()
+            if self._pending >= self.workers + self.max_queued:
+                raise QueueFullError("Review queue is full, please retry later")
+            job = Job(uuid.uuid4().hex, pr_url, on_event)
+            self._jobs[job.id] = job
+            self._pending += 1
+            self.latest_job_id = job.id
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job, marking it as recently used"""
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+            return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            processing = sum(1 for job in self._jobs.values() if job.status == "processing")
+            return {
+                "workers": self.workers,
+                "queue_depth": self.max_queued,
+                "pending": self._pending,
+                "processing": processing,
+                "queued": self._pending - processing,
+                "retained": len(self._jobs),
+            }
+
+    def _run(self, job: Job) -> None:
+        job.status = "processing"
+        job.started_at = time.time()
+        try:
+            job.result = self._event_loop().run_until_complete(self.handler(job))
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.on_event = None
+            with self._lock:
+                self._pending -= 1
+                self._evict()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        # One loop per worker thread, reused across jobs so that pooled
+        # HTTP connections survive between reviews.
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._local.loop = loop
+        return loop
+
+    def _evict(self) -> None:
+        """Drop expired finished jobs, then the least recently used ones over the cap"""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.is_finished]
+        for job in finished:
+            if now - job.finished_at > self.ttl_seconds:
+                del self._jobs[job.id]
+        excess = sum(1 for job in self._jobs.values() if job.is_finished) - self.max_finished
+        if excess > 0:
+            for job_id in [job.id for job in self._jobs.values() if job.is_finished][:excess]:
+                del self._jobs[job_id]
+        if self.latest_job_id not in self._jobs:
+            self.latest_job_id = None
@@ -1,81 +1,27 @@
 import openai
 import os
-import re
-from typing import List, Dict, Any
-import json
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Callable
 
-from models.feedback import ReviewFeedback, Issue, PRData
+from models.feedback import ReviewFeedback, Issue, PRData, TokenUsage
+from models.diff import Diff
+from services.diff_chunker import DiffChunk
+from services.events import ReviewEventHandler, emit
+from services.feedback_parser import FeedbackStreamParser
+from services.http_client import get_client, get_loop_local
+from services.incremental import carry_forward_issues
+from services.prompt_builder import PromptBuilder
+from services.static_analysis import StaticAnalyzer, StaticReport
+from services.review_cache import ReviewCache
+from services.structured_output import OUTPUT_MODES, answer_text, describe_error, request_options, validate_feedback
+from services.telemetry import current_span, parse_outcomes, repair_requests, span, structured_outcomes, tokens
 
-class PRAnalyzer:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    async def analyze_pr(self, pr_data: PRData) -> ReviewFeedback:
-        """Analyze PR and generate comprehensive feedback"""
-        
-        # Prepare context for AI analysis
-        context = self._prepare_analysis_context(pr_data)
-        
-        # Get AI analysis
-        ai_feedback = await self._get_ai_analysis(context)
-        
-        # Parse and structure the feedback
-        feedback = self._parse_ai_feedback(ai_feedback, pr_data)
-        
-        return feedback
-    
-    def _prepare_analysis_context(self, pr_data: PRData) -> str:
-        """Prepare context string for AI analysis"""
-        
-        files_summary = []
-        for file_data in pr_data.files_changed:
-            if isinstance(file_data, dict):
-                filename = file_data.get('filename', 'unknown')
-                status = file_data.get('status', 'modified')
-                additions = file_data.get('additions', 0)
-                deletions = file_data.get('deletions', 0)
-                files_summary.append(f"- {filename} ({status}): +{additions}/-{deletions}")
-        
-        context = f"""
-Pull Request Analysis Request:
-
-Title: {pr_data.title}
-Author: {pr_data.author}
-Provider: {pr_data.provider}
-
-Description:
-{pr_data.description}
-
-Files Changed:
-{chr(10).join(files_summary)}
-
-Diff:
-{pr_data.diff[:5000]}  # Limit diff size for API
+# Bump whenever the prompts change so cached reviews are not reused
+PROMPT_VERSION = "3"
 
-Please analyze this pull request and provide:
-1. A summary of the changes
-2. Code quality issues (errors, warnings, info)
-3. A score from 0-100
-4. Recommendations for improvement
-
-Focus on:
-- Code structure and organization
-- Potential bugs or security issues
-- Performance considerations
-- Best practices adherence
-- Readability and maintainability
-"""
-        return context
-    
-    async def _get_ai_analysis(self, context: str) -> str:
-        """Get analysis from OpenAI"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an expert code reviewer. Analyze the provided pull request and return a JSON response with the following structure:
+SYSTEM_PROMPT = """You are an expert code reviewer. Analyze the provided pull request and return a JSON response with the following structure:
 {
   "summary": "Brief summary of the changes and overall assessment",
   "score": 85,
@@ -94,87 +40,485 @@ Focus on:
 }
 
 Be thorough but constructive. Focus on actionable feedback."""
-                    },
-                    {
-                        "role": "user",
-                        "content": context
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
+
+REPAIR_PROMPT = """Your answer does not match the required review schema: {errors}
+Answer again with the complete review, fixing only these problems."""
+
+class CompletionLimiter:
+    """Process-wide cap on in-flight completions.
+    
+    Backed by a threading semaphore so that it also holds across the event
+    loops of the Flask worker threads; waiting is done by polling so a
+    cancelled waiter never leaks a slot.
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+    
+    async def __aenter__(self):
+        delay = 0.01
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+        self.in_flight += 1
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self._slots.release()
+
+# Shared by every PRAnalyzer in the process
+completion_limiter = CompletionLimiter(int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")))
+
+class PRAnalyzer:
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        # An OpenAI-compatible server to use instead of api.openai.com
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        # How the answer's structure is enforced; see services/structured_output.py
+        self.output_mode = os.getenv("REVIEW_OUTPUT_MODE", "text").lower()
+        if self.output_mode not in OUTPUT_MODES:
+            raise ValueError(f"REVIEW_OUTPUT_MODE must be one of: {', '.join(OUTPUT_MODES)}")
+        self.repair_attempts = int(os.getenv("REVIEW_REPAIR_ATTEMPTS", "1"))
+        # Per-request timeout and retry policy for completions
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+        self.retry_base_delay = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1.0"))
+        self.retry_max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))
+        self.cache = ReviewCache()
+        # Context window budget per model call and number of calls in flight per review
+        self.prompts = PromptBuilder(self.model, SYSTEM_PROMPT)
+        self.chunk_concurrency = int(os.getenv("REVIEW_CHUNK_CONCURRENCY", "4"))
+        # Rule engine run before the model; trivial PRs skip the model entirely
+        self.static = StaticAnalyzer()
+        self.skip_trivial = os.getenv("REVIEW_SKIP_TRIVIAL", "true").lower() not in ("0", "false", "no")
+        # Re-review only the commits pushed since a PR's previous review
+        self.incremental = os.getenv("REVIEW_INCREMENTAL", "true").lower() not in ("0", "false", "no")
+    
+    async def analyze_pr(self, pr_data: PRData, on_event: Optional[ReviewEventHandler] = None) -> ReviewFeedback:
+        """Analyze PR and generate comprehensive feedback, reporting progress to `on_event`"""
+        feedback, ok = await self._review_diff(pr_data, pr_data.parsed_diff, on_event)
+        if ok:
+            self.cache.put_last_review(pr_data, feedback)
+        return feedback
+    
+    async def analyze_pr_incremental(
+        self,
+        pr_data: PRData,
+        compare_diff: Diff,
+        base_sha: str,
+        previous: ReviewFeedback,
+        on_event: Optional[ReviewEventHandler] = None
+    ) -> ReviewFeedback:
+        """Review only the changes pushed since the review of `base_sha`.
+        
+        Issues of the previous review on lines the new commits left alone are
+        carried forward, with their line numbers moved along.
+        """
+        carried = carry_forward_issues(previous.issues, compare_diff)
+        emit(on_event, "incremental", {
+            "base_sha": base_sha,
+            "carried_issues": len(carried),
+            "dropped_issues": len(previous.issues) - len(carried)
+        })
+        
+        if not compare_diff.files:
+            feedback = previous.model_copy(update={"issues": carried, "usage": TokenUsage(exact=True)})
+            ok = True
+        else:
+            new, ok = await self._review_diff(pr_data, compare_diff, on_event)
+            # Weigh the new score by how much of the PR the new commits make up
+            changed = len(compare_diff)
+            unchanged = max(len(pr_data.parsed_diff) - changed, 1)
+            merged = self._merge_feedback(
+                [new, previous.model_copy(update={"issues": carried})], [changed, unchanged]
             )
+            feedback = merged.model_copy(update={
+                "summary": f"Re-reviewed the changes since {base_sha[:7]}. {new.summary}",
+                "usage": new.usage
+            })
+        
+        if ok:
+            self.cache.put_last_review(pr_data, feedback)
+        return feedback
+    
+    async def _review_diff(
+        self,
+        pr_data: PRData,
+        diff: Diff,
+        on_event: Optional[ReviewEventHandler] = None
+    ) -> Tuple[ReviewFeedback, bool]:
+        """Review `diff` in chunks; the flag is False unless every chunk got an AI review"""
+        
+        # Split the diff into chunks; their prompts are built only when reviewed
+        chunks, skipped_hunks = self.prompts.chunk(pr_data, diff)
+        chunks = chunks or [DiffChunk()]
+        emit(on_event, "diff_parsed", {
+            "files": len({path for chunk in chunks for path in chunk.files}),
+            "chunks": len(chunks),
+            "diff_tokens": sum(chunk.tokens for chunk in chunks),
+            "skipped_hunks": skipped_hunks
+        })
+        
+        # Serve repeated reviews of the same content from the cache; the key
+        # covers the PR metadata, the diff itself and how it was chunked. The
+        # file stats come from the diff, as the listing may still be arriving
+        key_context = "\n".join([
+            self.prompts.build(pr_data, DiffChunk(), files_from_diff=True),
+            f"{self.prompts.context_tokens}/{self.prompts.output_tokens}/{self.prompts.chunk_tokens}/{self.prompts.max_chunks}",
+            diff.digest()
+        ])
+        cache_key = self.cache.make_key(pr_data, self.model, PROMPT_VERSION, key_context)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            emit(on_event, "cached", {})
+            return cached, True
+        
+        # Deterministic checks run first; trivial PRs need nothing more, and
+        # for the rest they stand in for the model wherever it fails
+        with span("static_analysis") as static_span:
+            report = await asyncio.get_running_loop().run_in_executor(None, self.static.analyze, diff)
+            static_span.set(issues=len(report.issues))
+        emit(on_event, "static_analysis", {
+            "issues": len(report.issues),
+            "skip_reason": report.skip_reason
+        })
+        if report.skip_reason and self.skip_trivial:
+            feedback = report.to_feedback(f"{report.skip_reason}; reviewed with static analysis only.")
+            feedback.usage = TokenUsage(exact=True)
+            return feedback, True
+        
+        # Review the chunks concurrently, bounded by the concurrency limit
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        results = await asyncio.gather(
+            *(
+                self._analyze_chunk(chunk, pr_data, semaphore, (index, len(chunks)), report, on_event)
+                for index, chunk in enumerate(chunks, 1)
+            )
+        )
+        
+        if not any(ok for _, ok in results):
+            return report.to_feedback(
+                f"AI analysis unavailable; static analysis of {report.files} files found {len(report.issues)} issues."
+            ), False
+        feedback = self._merge_feedback(
+            [result for result, ok in results if ok],
+            [chunk.tokens for chunk, (_, ok) in zip(chunks, results) if ok]
+        )
+        feedback = self._add_static_findings(feedback, report)
+        feedback.usage = (feedback.usage or TokenUsage()) + TokenUsage(skipped_hunks=skipped_hunks, exact=True)
+        
+        # Only complete, successful AI reviews are worth reusing
+        complete = all(ok for _, ok in results)
+        if complete:
+            self.cache.put(cache_key, feedback)
+        return feedback, complete
+    
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """Async OpenAI client for the running event loop, sharing its connection pool"""
+        return get_loop_local("openai", lambda: openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,  # retries are handled by _get_ai_analysis
+            http_client=get_client("openai-http")
+        ))
+    
+    async def _analyze_chunk(
+        self,
+        chunk: DiffChunk,
+        pr_data: PRData,
+        semaphore: asyncio.Semaphore,
+        part: Tuple[int, int],
+        report: StaticReport,
+        on_event: Optional[ReviewEventHandler] = None
+    ) -> Tuple[ReviewFeedback, bool]:
+        """Review one chunk; the flag is False when a fallback had to be used"""
+        # Stream the completion only when someone is listening for tokens;
+        # the answer is then parsed as it arrives and issues reported early
+        stream = on_event is not None
+        parser = FeedbackStreamParser(
+            on_issue=lambda issue: on_event("issue", {"chunk": part[0], **issue.model_dump()})
+        ) if stream else None
+        
+        def on_token(text):
+            on_event("token", {"chunk": part[0], "text": text})
+            parser.feed(text)
+        
+        with span("chunk", chunk=part[0], chunk_tokens=chunk.tokens) as chunk_span:
+            # Only the files this chunk summarises need to have been listed
+            await pr_data.wait_for_files(chunk.files if part[1] > 1 else None)
+            async with semaphore:
+                with span("prepare_analysis_context"):
+                    context = self._prepare_analysis_context(pr_data, chunk, part)
+                # Get AI analysis, falling back to the static findings if AI fails
+                try:
+                    with span("ai_analysis", model=self.model, streamed=stream) as ai_span:
+                        ai_feedback, usage = await self._get_ai_analysis(context, on_token if stream else None)
+                        ai_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                    self._record_usage(usage)
+                except Exception:
+                    ai_feedback, usage = None, None
             
-            return response.choices[0].message.content
-        
-        except Exception as e:
-            # Fallback to basic analysis if AI fails
-            return self._generate_fallback_analysis(context)
-    
-    def _generate_fallback_analysis(self, context: str) -> str:
-        """Generate basic analysis if AI is unavailable"""
-        return json.dumps({
-            "summary": "Basic analysis completed. AI service unavailable, using rule-based analysis.",
-            "score": 75,
-            "issues": [
-                {
-                    "type": "info",
-                    "file": "general",
-                    "message": "AI analysis unavailable, performed basic checks",
-                    "suggestion": "Ensure proper error handling and testing"
-                }
+            # Parse and structure the feedback
+            if ai_feedback is None:
+                feedback, ok = self._generate_fallback_analysis(report, chunk), False
+            else:
+                try:
+                    with span("parse_ai_feedback", response_chars=len(ai_feedback or ""), mode=self.output_mode):
+                        if self.output_mode == "text":
+                            feedback = self._parse_ai_feedback(ai_feedback, pr_data, parser)
+                        else:
+                            feedback, usage = await self._validate_structured(context, ai_feedback, usage, pr_data, parser)
+                    ok = True
+                except Exception as e:
+                    parse_outcomes.inc(outcome="failed")
+                    feedback, ok = self._generate_parse_failure_feedback(e), False
+            feedback.usage = usage
+            chunk_span.set(fallback=not ok)
+        
+        emit(on_event, "chunk_reviewed", {
+            "chunk": part[0],
+            "total": part[1],
+            "score": feedback.score,
+            "issues": len(feedback.issues),
+            "fallback": not ok
+        })
+        return feedback, ok
+    
+    @staticmethod
+    def _add_static_findings(feedback: ReviewFeedback, report: StaticReport) -> ReviewFeedback:
+        """Add the rule engine's issues and recommendations the model did not already give"""
+        seen = {(issue.file, issue.line, issue.message) for issue in feedback.issues}
+        return feedback.model_copy(update={
+            "issues": feedback.issues + [
+                issue for issue in report.issues if (issue.file, issue.line, issue.message) not in seen
             ],
-            "recommendations": [
-                "Add comprehensive unit tests",
-                "Ensure proper error handling",
-                "Follow coding standards",
-                "Add documentation for new features"
-            ]
+            "recommendations": list(dict.fromkeys(feedback.recommendations + report.recommendations))
         })
     
-    def _parse_ai_feedback(self, ai_response: str, pr_data: PRData) -> ReviewFeedback:
-        """Parse AI response into structured feedback"""
-        try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                feedback_data = json.loads(json_match.group())
-            else:
-                feedback_data = json.loads(ai_response)
-            
-            # Convert to our model
-            issues = []
-            for issue_data in feedback_data.get("issues", []):
-                issues.append(Issue(
-                    type=issue_data.get("type", "info"),
-                    file=issue_data.get("file", "unknown"),
-                    line=issue_data.get("line"),
-                    message=issue_data.get("message", ""),
-                    suggestion=issue_data.get("suggestion")
-                ))
-            
-            return ReviewFeedback(
-                summary=feedback_data.get("summary", "Analysis completed"),
-                score=max(0, min(100, feedback_data.get("score", 75))),
-                issues=issues,
-                recommendations=feedback_data.get("recommendations", [])
-            )
+    def _merge_feedback(self, results: List[ReviewFeedback], weights: List[int]) -> ReviewFeedback:
+        """Combine per-chunk feedback into one review"""
+        if len(results) == 1:
+            return results[0]
+        
+        issues = []
+        seen_issues = set()
+        for issue in (issue for result in results for issue in result.issues):
+            key = (issue.file, issue.line, issue.message)
+            if key not in seen_issues:
+                seen_issues.add(key)
+                issues.append(issue)
         
-        except Exception as e:
-            # Fallback if parsing fails
-            return ReviewFeedback(
-                summary=f"Analysis completed with parsing issues: {str(e)}",
-                score=70,
-                issues=[
-                    Issue(
-                        type="warning",
-                        file="parser",
-                        message="Could not parse AI response completely",
-                        suggestion="Review the changes manually"
+        recommendations = list(dict.fromkeys(rec for result in results for rec in result.recommendations))
+        summaries = list(dict.fromkeys(result.summary for result in results))
+        total_weight = sum(max(weight, 1) for weight in weights)
+        score = sum(result.score * max(weight, 1) for result, weight in zip(results, weights)) / total_weight
+        
+        usages = [result.usage for result in results if result.usage is not None]
+        
+        return ReviewFeedback(
+            summary=f"Reviewed in {len(results)} parts. " + " ".join(summaries),
+            score=round(score),
+            issues=issues,
+            recommendations=recommendations,
+            usage=sum(usages[1:], usages[0]) if usages else None
+        )
+    
+    def _prepare_analysis_context(
+        self,
+        pr_data: PRData,
+        chunk: Optional[DiffChunk] = None,
+        part: Tuple[int, int] = (1, 1)
+    ) -> str:
+        """Prepare context string for AI analysis of one diff chunk"""
+        return self.prompts.build(pr_data, chunk or DiffChunk(), part)
+    
+    async def _get_ai_analysis(
+        self,
+        context: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        repair: Optional[Tuple[str, str]] = None
+    ) -> Tuple[str, TokenUsage]:
+        """Get analysis from OpenAI, retrying rate limits and server errors.
+        
+        With `on_token` the completion is streamed and each text delta is
+        passed to it as it arrives. Token usage is taken from the API when it
+        reports it and counted locally otherwise. `repair` is a previous
+        answer and what was wrong with it, for the model to correct.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": context
+            }
+        ]
+        if repair is not None:
+            previous, errors = repair
+            messages.append({"role": "assistant", "content": previous or ""})
+            messages.append({"role": "user", "content": REPAIR_PROMPT.format(errors=errors)})
+        attempt = 0
+        while True:
+            try:
+                async with completion_limiter:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=self.prompts.output_tokens,
+                        timeout=self.timeout,
+                        stream=on_token is not None,
+                        **request_options(self.output_mode)
                     )
-                ],
-                recommendations=[
-                    "Manual review recommended",
-                    "Check for common code issues",
-                    "Ensure tests are included"
-                ]
-            )
\ No newline at end of file
+                    if on_token is None:
+                        content = answer_text(response.choices[0].message)
+                        if response.usage is not None:
+                            return content, TokenUsage(
+                                prompt_tokens=response.usage.prompt_tokens,
+                                completion_tokens=response.usage.completion_tokens,
+                                total_tokens=response.usage.total_tokens,
+                                calls=1,
+                                exact=True
+                            )
+                        return content, self._count_usage(context, content)
+                    
+                    parts = []
+                    async for event in response:
+                        # Text, or the arguments of the forced tool call
+                        delta = answer_text(event.choices[0].delta) if event.choices else None
+                        if delta:
+                            parts.append(delta)
+                            on_token(delta)
+                    content = "".join(parts)
+                    return content, self._count_usage(context, content)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+    
+    async def _validate_structured(
+        self,
+        context: str,
+        answer: str,
+        usage: TokenUsage,
+        pr_data: PRData,
+        parser: Optional[FeedbackStreamParser] = None
+    ) -> Tuple[ReviewFeedback, TokenUsage]:
+        """Validate a structured answer straight into the models.
+        
+        An answer that does not fit is sent back with the validation errors,
+        at most `repair_attempts` times; the lenient parser gets the last one.
+        """
+        for attempt in range(self.repair_attempts + 1):
+            try:
+                feedback = validate_feedback(answer)
+            except ValueError as e:
+                error = e
+            else:
+                structured_outcomes.inc(outcome="valid" if attempt == 0 else "repaired")
+                return feedback, usage
+            if attempt == self.repair_attempts:
+                break
+            repair_requests.inc()
+            try:
+                with span("repair_ai_feedback", attempt=attempt + 1):
+                    answer, repair_usage = await self._get_ai_analysis(context, repair=(answer, describe_error(error)))
+            except Exception:
+                break
+            self._record_usage(repair_usage)
+            usage = usage + repair_usage
+        structured_outcomes.inc(outcome="failed")
+        return self._parse_ai_feedback(answer, pr_data, parser), usage
+    
+    @staticmethod
+    def _record_usage(usage: TokenUsage) -> None:
+        tokens.inc(usage.prompt_tokens, kind="prompt")
+        tokens.inc(usage.completion_tokens, kind="completion")
+    
+    def _count_usage(self, context: str, completion: str) -> TokenUsage:
+        """Usage of one call counted with the local tokenizer"""
+        count = self.prompts.count
+        prompt_tokens = count(SYSTEM_PROMPT) + count(context)
+        completion_tokens = count(completion or "")
+        return TokenUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            calls=1,
+            exact=count.exact
+        )
+    
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Exponential backoff with full jitter, honouring Retry-After when given"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.retry_max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+    
+    def _generate_fallback_analysis(self, report: StaticReport, chunk: DiffChunk) -> ReviewFeedback:
+        """Static-analysis findings for the chunk's files when AI is unavailable"""
+        return report.to_feedback(
+            "AI service unavailable; using rule-based analysis.",
+            paths=chunk.files
+        )
+    
+    def _parse_ai_feedback(
+        self,
+        ai_response: str,
+        pr_data: PRData,
+        parser: Optional[FeedbackStreamParser] = None
+    ) -> ReviewFeedback:
+        """Parse AI response into structured feedback.
+        
+        `parser` is the one the streamed answer was fed to as it arrived; it
+        is only reused if it saw exactly this answer (not a failed attempt).
+        """
+        if parser is None or parser.text != ai_response:
+            parser = FeedbackStreamParser()
+            parser.feed(ai_response)
+        feedback = parser.close()
+        parse_outcomes.inc(outcome="repaired" if parser.repaired else "complete")
+        current = current_span()
+        if current is not None:
+            current.set(repaired=parser.repaired, dropped_issues=parser.dropped)
+        return feedback
+    
+    def _generate_parse_failure_feedback(self, error: Exception) -> ReviewFeedback:
+        """Fallback feedback if the AI response could not be parsed"""
+        return ReviewFeedback(
+            summary=f"Analysis completed with parsing issues: {str(error)}",
+            score=70,
+            issues=[
+                Issue(
+                    type="warning",
+                    file="parser",
+                    message="Could not parse AI response completely",
+                    suggestion="Review the changes manually"
+                )
+            ],
+            recommendations=[
+                "Manual review recommended",
+                "Check for common code issues",
+                "Ensure tests are included"
+            ]
+        )
@@ -0,0 +1,219 @@
+"""
+Token-budgeted review prompts: exact token counts and priority-ordered filling of the context window
+"""
+import os
+import re
+from typing import List, Optional, Tuple
+
+from models.diff import Diff
+from models.feedback import PRData
+from services.diff_chunker import DiffChunk, chunk_diff, estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to the estimate
+    tiktoken = None
+
+# Shares of the input budget the PR description and the file summary may take
+DESCRIPTION_SHARE = 0.1
+FILES_SUMMARY_SHARE = 0.1
+
+# Diff tokens a call gets even when the fixed parts of the prompt are large
+MIN_DIFF_TOKENS = 256
+
+_HIGH_RISK_PATH = re.compile(
+    r'auth|login|passw|secret|token|crypt|security|permission|session|payment|billing'
+    r'|sql|query|migration|\.sql$|dockerfile|\.github/workflows|settings|config',
+    re.IGNORECASE,
+)
+_LOW_RISK_PATH = re.compile(
+    r'(^|/)(tests?|docs?|__tests__|fixtures|vendor|dist|build)/|\.(md|rst|txt|lock|svg|png|snap)$'
+    r'|(^|/)(package-lock\.json|yarn\.lock|poetry\.lock|Pipfile\.lock|go\.sum|Cargo\.lock)$',
+    re.IGNORECASE,
+)
+_RISKY_CODE = re.compile(
+    rb'^\+.*(?:eval\(|exec\(|subprocess|os\.system|shell=True|pickle\.loads|yaml\.load\('
+    rb'|password|secret|api_?key|token|verify=False|innerHTML|dangerouslySetInnerHTML'
+    rb'|SELECT |INSERT |UPDATE |DELETE |DROP |chmod|sudo|TODO|FIXME|except:|catch\s*\()',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+PROMPT_TEMPLATE = """
+Pull Request Analysis Request:
+
+Title: {title}
+Author: {author}
+Provider: {provider}
+
+Description:
+{description}
+
+Files Changed:
+{files_summary}
+
+Diff{part_label}:
+{diff}
+
+Please analyze this pull request and provide:
+1. A summary of the changes
+2. Code quality issues (errors, warnings, info)
+3. A score from 0-100
+4. Recommendations for improvement
+
+Focus on:
+- Code structure and organization
+- Potential bugs or security issues
+- Performance considerations
+- Best practices adherence
+- Readability and maintainability
+"""
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer when tiktoken is installed"""
+
+    def __init__(self, model: str):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                try:
+                    self.encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # The encoding could not be loaded (e.g. offline on first use)
+                self.encoding = None
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def __call__(self, text: str) -> int:
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut `text` to at most `max_tokens`, marking the cut"""
+        if self(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            cut = text[:max(max_tokens - 8, 0) * 4]
+        else:
+            cut = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max(max_tokens - 8, 0)])
+        return cut.rstrip() + "\n[... truncated]"
+
+
+def hunk_risk(path: Optional[str], diff: Diff, start: int, end: int) -> float:
+    """Heuristic risk of one hunk: what the file is and what the added lines do"""
+    risk = 1.0
+    if path:
+        if _HIGH_RISK_PATH.search(path):
+            risk += 2.0
+        if _LOW_RISK_PATH.search(path):
+            risk -= 0.9
+    body = bytes(diff.buffer[start:end])
+    risk += min(len(_RISKY_CODE.findall(body)), 10) * 0.5
+    # Larger changes carry more risk, with diminishing weight
+    risk += min((body.count(b"\n+") + body.count(b"\n-")) / 50, 2.0)
+    return risk
+
+
+class PromptBuilder:
+    """Builds review prompts that fit the model's context window.
+
+    The window is `context_tokens`, of which `output_tokens` are reserved
+    for the answer. The rest is filled by priority: title and description,
+    then the changed-file summary (each capped to a share of the budget),
+    then diff hunks, highest risk first.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        system_prompt: str,
+        context_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        chunk_tokens: Optional[int] = None,
+        max_chunks: Optional[int] = None,
+    ):
+        self.count = TokenCounter(model)
+        self.system_prompt = system_prompt
+        self.context_tokens = context_tokens or int(os.getenv("REVIEW_CONTEXT_TOKENS", "16385"))
+        self.output_tokens = output_tokens or int(os.getenv("REVIEW_OUTPUT_TOKENS", "2000"))
+        # Optional caps on the diff tokens per call and the number of calls per review
+        self.chunk_tokens = chunk_tokens if chunk_tokens is not None else int(os.getenv("REVIEW_CHUNK_TOKENS", "0"))
+        self.max_chunks = max_chunks if max_chunks is not None else int(os.getenv("REVIEW_MAX_CHUNKS", "0"))
+
+    @property
+    def input_tokens(self) -> int:
+        return max(self.context_tokens - self.output_tokens - self.count(self.system_prompt), MIN_DIFF_TOKENS)
+
+    def chunk(self, pr_data: PRData, diff: Diff) -> Tuple[List[DiffChunk], int]:
+        """Pack `diff` into as few prompts as the budget allows.
+
+        Returns the chunks, riskiest hunks first, and the number of hunks
+        left out because of `max_chunks`.
+        """
+        # The file listing may still be arriving; the diff lists the same files
+        overhead = self.count(self.build(pr_data, DiffChunk(), files_from_diff=True))
+        diff_tokens = max(self.input_tokens - overhead, MIN_DIFF_TOKENS)
+        if self.chunk_tokens:
+            diff_tokens = min(diff_tokens, self.chunk_tokens)
+        chunks = chunk_diff(
+            diff,
+            diff_tokens,
+            count_tokens=self.count if self.count.exact else None,
+            risk=lambda path, start, end: hunk_risk(path, diff, start, end),
+        )
+        if not self.max_chunks or len(chunks) <= self.max_chunks:
+            return chunks, 0
+        skipped = sum(chunk.hunks for chunk in chunks[self.max_chunks:])
+        return chunks[:self.max_chunks], skipped
+
+    def build(
+        self,
+        pr_data: PRData,
+        chunk: DiffChunk,
+        part: Tuple[int, int] = (1, 1),
+        files_from_diff: bool = False,
+    ) -> str:
+        """The user prompt for one chunk of the PR"""
+        description = self.count.truncate(pr_data.description, int(self.input_tokens * DESCRIPTION_SHARE))
+        files_summary = self.count.truncate(
+            "\n".join(self._files_summary(pr_data, chunk, part, files_from_diff)),
+            int(self.input_tokens * FILES_SUMMARY_SHARE),
+        )
+        return PROMPT_TEMPLATE.format(
+            title=pr_data.title,
+            author=pr_data.author,
+            provider=pr_data.provider,
+            description=description,
+            files_summary=files_summary,
+            part_label=f" (part {part[0]} of {part[1]})" if part[1] > 1 else "",
+            diff=chunk.text,
+        )
+
+    @staticmethod
+    def _files_summary(
+        pr_data: PRData, chunk: DiffChunk, part: Tuple[int, int], files_from_diff: bool = False
+    ) -> List[str]:
+        files_summary = []
+        for file_data in [] if files_from_diff else pr_data.files_changed:
+            if isinstance(file_data, dict):
+                filename = file_data.get('filename', file_data.get('new_path', 'unknown'))
+                # Only summarise the files this chunk covers
+                if part[1] > 1 and filename not in chunk.files:
+                    continue
+                status = file_data.get('status', 'modified')
+                additions = file_data.get('additions', 0)
+                deletions = file_data.get('deletions', 0)
+                files_summary.append(f"- {filename} ({status}): +{additions}/-{deletions}")
+        if files_from_diff or not pr_data.files_changed:
+            # Providers without a file listing: take the stats from the diff itself
+            for file_diff in pr_data.parsed_diff.files:
+                if file_diff.path is None or (part[1] > 1 and file_diff.path not in chunk.files):
+                    continue
+                status = "added" if file_diff.added else "removed" if file_diff.deleted else "modified"
+                files_summary.append(f"- {file_diff.path} ({status}): +{file_diff.additions}/-{file_diff.deletions}")
+        return files_summary
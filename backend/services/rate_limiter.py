@@ -0,0 +1,156 @@
+"""
+Provider-aware scheduler that paces API calls to the advertised rate-limit budget
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to wait longer than allowed for budget"""
+
+
+class _Budget:
+    """What a provider last told us about one token's budget"""
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.paused_until = 0.0
+        self.next_slot = 0.0
+
+
+def _header(headers: httpx.Headers, *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class RateLimitScheduler:
+    """Token-bucket style pacing per (provider, token).
+
+    Budgets are learned from `X-RateLimit-*` (GitHub, Bitbucket) and
+    `RateLimit-*` (GitLab) headers. While more than `reserve` calls remain,
+    requests go straight through; below that the remaining calls are spread
+    evenly until the reset time, and with nothing left requests wait for the
+    reset. `Retry-After` pauses the budget outright.
+    """
+
+    def __init__(self, reserve: Optional[int] = None, max_wait: Optional[float] = None):
+        self.reserve = reserve if reserve is not None else int(os.getenv("RATE_LIMIT_RESERVE", "50"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("RATE_LIMIT_MAX_WAIT", "300"))
+        self.waiting = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.longest_wait = 0.0
+        self._budgets: Dict[Tuple[str, str], _Budget] = {}
+        self._lock = threading.Lock()
+
+    async def acquire(self, provider: str, token_key: str) -> float:
+        """Wait until a call may be made; returns the time spent waiting"""
+        with self._lock:
+            delay = self._reserve_slot(self._budgets.setdefault((provider, token_key), _Budget()), time.time())
+        if delay <= 0:
+            return 0.0
+        if delay > self.max_wait:
+            raise RateLimitExceeded(
+                f"{provider} rate limit exhausted, next call possible in {delay:.0f}s"
+            )
+
+        with self._lock:
+            self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self.waits += 1
+                self.total_wait += delay
+                self.longest_wait = max(self.longest_wait, delay)
+        return delay
+
+    def _reserve_slot(self, budget: _Budget, now: float) -> float:
+        if now < budget.paused_until:
+            return budget.paused_until - now
+        if budget.reset_at is not None and now >= budget.reset_at:
+            # The window has rolled over; the next response tells us the new budget
+            budget.remaining = budget.reset_at = None
+        if budget.remaining is None or budget.reset_at is None:
+            return 0.0
+        if budget.remaining > self.reserve:
+            budget.remaining -= 1
+            return 0.0
+        if budget.remaining <= 0:
+            return budget.reset_at - now
+
+        # Low on budget: spread the remaining calls evenly until the reset
+        interval = (budget.reset_at - now) / budget.remaining
+        start = max(now, budget.next_slot)
+        budget.next_slot = start + interval
+        budget.remaining -= 1
+        return start - now
+
+    def update(self, provider: str, token_key: str, response: httpx.Response) -> bool:
+        """Learn the budget from a response; returns True if it was rate limited"""
+        headers = response.headers
+        now = time.time()
+        remaining = _header(headers, "x-ratelimit-remaining", "ratelimit-remaining")
+        limit = _header(headers, "x-ratelimit-limit", "ratelimit-limit")
+        reset = _header(headers, "x-ratelimit-reset", "ratelimit-reset")
+        retry_after = headers.get("retry-after")
+
+        with self._lock:
+            budget = self._budgets.setdefault((provider, token_key), _Budget())
+            try:
+                if remaining is not None:
+                    budget.remaining = int(remaining)
+                if limit is not None:
+                    budget.limit = int(limit)
+                if reset is not None:
+                    reset_value = float(reset)
+                    # Epoch seconds (GitHub, GitLab) or seconds from now
+                    budget.reset_at = reset_value if reset_value > 1e9 else now + reset_value
+            except ValueError:
+                pass
+
+            limited = response.status_code == 429 or (
+                response.status_code == 403 and (retry_after is not None or budget.remaining == 0)
+            )
+            if limited:
+                if retry_after is not None:
+                    try:
+                        budget.paused_until = now + float(retry_after)
+                    except ValueError:
+                        budget.paused_until = now + 60
+                elif budget.reset_at is not None:
+                    budget.paused_until = budget.reset_at
+                else:
+                    budget.paused_until = now + 60
+        return limited
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "waiting": self.waiting,
+                "waits": self.waits,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "average_wait_seconds": round(self.total_wait / self.waits, 3) if self.waits else 0.0,
+                "longest_wait_seconds": round(self.longest_wait, 3),
+                "budgets": [
+                    {
+                        "provider": provider,
+                        "token": token_key,
+                        "limit": budget.limit,
+                        "remaining": budget.remaining,
+                        "reset_at": budget.reset_at,
+                    }
+                    for (provider, token_key), budget in self._budgets.items()
+                ],
+            }
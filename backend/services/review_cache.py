@@ -0,0 +1,168 @@
+"""
+Persistent, content-addressed cache of review results
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from models.feedback import PRData, ReviewFeedback
+
+
+class ReviewCache:
+    """SQLite-backed store of ReviewFeedback keyed by what was reviewed and how.
+
+    Entries older than `max_age_seconds` are never served, and once the
+    stored payloads exceed `max_bytes` the least recently used entries are
+    evicted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.path = path or os.getenv("REVIEW_CACHE_PATH", "review_cache.db")
+        self.max_bytes = max_bytes or int(os.getenv("REVIEW_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.max_age_seconds = max_age_seconds or float(os.getenv("REVIEW_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS reviews (
+                key TEXT PRIMARY KEY,
+                feedback TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_reviews_accessed_at ON reviews (accessed_at)")
+        # The most recent review of each PR, the base of incremental re-reviews
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS last_reviews (
+                pr TEXT PRIMARY KEY,
+                head_sha TEXT NOT NULL,
+                feedback TEXT NOT NULL,
+                reviewed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(pr_data: PRData, model: str, prompt_version: str, context: str) -> str:
+        """Key a review by PR identity, head commit, model, prompt version and prompt content"""
+        context_hash = hashlib.sha256(context.encode("utf-8", "surrogatepass")).hexdigest()
+        identity = [
+            pr_data.provider,
+            pr_data.repo,
+            pr_data.number,
+            pr_data.head_sha,
+            model,
+            prompt_version,
+            context_hash,
+        ]
+        return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[ReviewFeedback]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT feedback, created_at FROM reviews WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM reviews WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE reviews SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return ReviewFeedback.model_validate_json(row[0])
+
+    def put(self, key: str, feedback: ReviewFeedback) -> None:
+        payload = feedback.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reviews (key, feedback, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    @staticmethod
+    def pr_identity(pr_data: PRData) -> Optional[str]:
+        if pr_data.repo is None or pr_data.number is None:
+            return None
+        return f"{pr_data.provider}:{pr_data.repo}#{pr_data.number}"
+
+    def get_last_review(self, pr_data: PRData) -> Optional[Tuple[str, ReviewFeedback]]:
+        """Head SHA and feedback of the latest review of this PR, if it has not expired"""
+        identity = self.pr_identity(pr_data)
+        if identity is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT head_sha, feedback, reviewed_at FROM last_reviews WHERE pr = ?", (identity,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.max_age_seconds:
+            return None
+        return row[0], ReviewFeedback.model_validate_json(row[1])
+
+    def put_last_review(self, pr_data: PRData, feedback: ReviewFeedback) -> None:
+        identity = self.pr_identity(pr_data)
+        if identity is None or not pr_data.head_sha:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO last_reviews (pr, head_sha, feedback, reviewed_at) VALUES (?, ?, ?, ?)",
+                (identity, pr_data.head_sha, feedback.model_dump_json(), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM last_reviews WHERE reviewed_at < ?", (time.time() - self.max_age_seconds,)
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reviews"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM reviews WHERE created_at < ?", (now - self.max_age_seconds,)
+        ).rowcount
+        self.evictions += expired
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM reviews").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM reviews ORDER BY accessed_at"
+        ).fetchall():
+            self._conn.execute("DELETE FROM reviews WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,110 @@
+"""
+End-to-end review pipeline shared by the Flask app, the FastAPI app and the CLI
+"""
+import time
+from typing import Optional, Tuple
+
+from models.feedback import PRData, ReviewFeedback
+from services.events import ReviewEventHandler, emit
+from services.git_providers import GitProvider, GitProviderFactory
+from services.pr_analyzer import PRAnalyzer
+from services.single_flight import SingleFlight, normalize_pr_url
+from services.telemetry import gauge_from, review_seconds, reviews_in_flight, span
+
+# Reviews in progress, so concurrent requests for the same PR share one
+in_flight = SingleFlight()
+gauge_from("pr_review_single_flight_keys", "Distinct PRs being reviewed, however many callers wait on each", in_flight.in_flight)
+
+
+async def review_pr(
+    pr_url: str,
+    analyzer: PRAnalyzer,
+    on_event: Optional[ReviewEventHandler] = None,
+) -> Tuple[PRData, ReviewFeedback]:
+    """Fetch a PR from its provider and analyze it, reporting each stage to `on_event`"""
+    start = time.perf_counter()
+    outcome = "error"
+    reviews_in_flight.inc()
+    try:
+        with span("review", pr_url=pr_url) as review:
+            emit(on_event, "fetching", {"pr_url": pr_url})
+            with span("get_provider"):
+                provider = GitProviderFactory.get_provider(pr_url)
+            review.set(provider=provider.name)
+            # The flight covers fetching the PR too, so callers that join it
+            # share the file listing and diff download as well
+            pr_data, feedback = await in_flight.run(
+                review_key(pr_url, analyzer),
+                lambda forward: _fetch_and_analyze(provider, pr_url, analyzer, forward),
+                on_event,
+            )
+            review.set(score=feedback.score, issues=len(feedback.issues))
+        outcome = "ok"
+    except Exception as e:
+        emit(on_event, "error", {"message": str(e)})
+        raise
+    finally:
+        reviews_in_flight.dec()
+        review_seconds.observe(time.perf_counter() - start, outcome=outcome)
+
+    emit(on_event, "feedback", feedback.model_dump())
+    return pr_data, feedback
+
+
+def review_key(pr_url: str, analyzer: PRAnalyzer) -> str:
+    """Identifies one review: the PR and the model reviewing it.
+
+    The head commit is only known once the PR is fetched, and fetching it is
+    part of the work shared, so a request for a PR already being reviewed
+    gets that review even if a new commit was pushed in the meantime.
+    """
+    return f"{normalize_pr_url(pr_url)}:{analyzer.model}"
+
+
+async def _fetch_and_analyze(
+    provider: GitProvider,
+    pr_url: str,
+    analyzer: PRAnalyzer,
+    on_event: Optional[ReviewEventHandler] = None,
+) -> Tuple[PRData, ReviewFeedback]:
+    """Fetch the PR and review it, waiting for its full file listing"""
+    with span("get_pr_data", provider=provider.name) as fetch:
+        pr_data = await provider.get_pr_data(pr_url)
+        fetch.set(files_changed=pr_data.files_total)
+    emit(on_event, "fetched", {
+        "title": pr_data.title,
+        "author": pr_data.author,
+        "files_changed": pr_data.files_total,
+    })
+    try:
+        feedback = await _analyze(provider, pr_data, analyzer, on_event)
+        # Callers get the complete file listing, even if the review needed less of it
+        await pr_data.wait_for_files()
+    finally:
+        pr_data.close_files()
+    return pr_data, feedback
+
+
+async def _analyze(
+    provider: GitProvider,
+    pr_data: PRData,
+    analyzer: PRAnalyzer,
+    on_event: Optional[ReviewEventHandler] = None,
+) -> ReviewFeedback:
+    """Re-review only the new commits when the PR was reviewed at an older head"""
+    last_review = analyzer.cache.get_last_review(pr_data) if analyzer.incremental else None
+    if last_review is not None and pr_data.head_sha:
+        base_sha, previous = last_review
+        if base_sha == pr_data.head_sha:
+            # Already reviewed at this head, perhaps incrementally, in which
+            # case nothing is stored under the full-diff cache key
+            emit(on_event, "cached", {})
+            return previous
+        try:
+            compare_diff = await provider.get_compare_diff(pr_data, base_sha, pr_data.head_sha)
+        except Exception:
+            # Unsupported, or the old head is gone after a force-push
+            compare_diff = None
+        if compare_diff is not None:
+            return await analyzer.analyze_pr_incremental(pr_data, compare_diff, base_sha, previous, on_event)
+    return await analyzer.analyze_pr(pr_data, on_event=on_event)
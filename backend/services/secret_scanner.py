@@ -0,0 +1,199 @@
+"""
+Secret scanner: every credential pattern in one compiled regex, run once over the raw diff
+"""
+import math
+import re
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.diff import Diff, FileDiff, Hunk
+from models.feedback import Issue
+
+# name -> (pattern, trigger literals, description). Triggers are lowercase strings
+# one of which every match contains; only the few lines holding a trigger are
+# searched with the full patterns. Only the generic rule has a group of its own,
+# `value`, since group names must be unique across the combined regex.
+SECRET_PATTERNS: Dict[str, Tuple[bytes, Tuple[bytes, ...], str]] = {
+    "private_key": (
+        rb'-----BEGIN (?:RSA |EC |DSA |OPENSSH |PGP |ENCRYPTED )?PRIVATE KEY(?: BLOCK)?-----',
+        (b"-----begin",), "Private key",
+    ),
+    "aws_access_key": (
+        rb'\b(?:AKIA|ASIA|AGPA|AIDA|AROA|ANPA|ANVA|AIPA)[0-9A-Z]{16}\b',
+        (b"akia", b"asia", b"agpa", b"aida", b"aroa", b"anpa", b"anva", b"aipa"), "AWS access key ID",
+    ),
+    "github_token": (
+        rb'\b(?:gh[pousr]_[A-Za-z0-9]{36,255}|github_pat_[A-Za-z0-9_]{22,255})\b',
+        (b"ghp_", b"gho_", b"ghu_", b"ghs_", b"ghr_", b"github_pat_"), "GitHub token",
+    ),
+    "gitlab_token": (rb'\bglpat-[A-Za-z0-9_\-]{20,}\b', (b"glpat-",), "GitLab personal access token"),
+    "slack_token": (rb'\bxox[abposr]-[A-Za-z0-9-]{10,}\b', (b"xox",), "Slack token"),
+    "slack_webhook": (
+        rb'https://hooks\.slack\.com/services/T[A-Za-z0-9_]+/B[A-Za-z0-9_]+/[A-Za-z0-9_]+',
+        (b"hooks.slack.com",), "Slack webhook URL",
+    ),
+    "stripe_key": (rb'\b(?:sk|rk)_live_[A-Za-z0-9]{20,}\b', (b"_live_",), "Stripe live secret key"),
+    "google_api_key": (rb'\bAIza[0-9A-Za-z_\-]{35}\b', (b"aiza",), "Google API key"),
+    "openai_key": (
+        rb'\bsk-(?:proj-)?[A-Za-z0-9_\-]{20,}T3BlbkFJ[A-Za-z0-9_\-]{20,}\b|\bsk-[A-Za-z0-9]{48}\b',
+        (b"sk-",), "OpenAI API key",
+    ),
+    "jwt": (
+        rb'\beyJ[A-Za-z0-9_\-]{10,}\.eyJ[A-Za-z0-9_\-]{10,}\.[A-Za-z0-9_\-]{10,}',
+        (b"eyj",), "JSON Web Token",
+    ),
+    "url_password": (
+        rb'\b[a-z][a-z0-9+.\-]*://[^/\s:@\'"]+:[^/\s:@\'"$<{]{6,}@',
+        (b"://",), "Password in a connection URL",
+    ),
+    # Keyword-gated assignments; the value must also pass the entropy check
+    "generic": (
+        rb'(?i:passw(?:or)?d|passwd|secret|api_?key|access_?key|access_?token|auth_?token|client_?secret|private_?key)'
+        rb'\w*["\']?[ \t]*(?::=|=>|[:=])[ \t]*["\'](?P<value>[^"\'\s]{8,})["\']',
+        (b"passw", b"secret", b"api_key", b"apikey", b"access_key", b"accesskey", b"access_token",
+         b"accesstoken", b"auth_token", b"authtoken", b"private_key", b"privatekey"),
+        "Hardcoded credential",
+    ),
+}
+
+# Block size for lowercasing the buffer ahead of the trigger search
+_SCAN_BLOCK = 8 * 1024 * 1024
+
+# Placeholders that look like assignments but carry no secret
+_PLACEHOLDER = re.compile(
+    r'^(?:\$\{?|<|%\(|\{\{)|changeme|change_me|example|dummy|placeholder|your[_-]|xxxx|\*\*\*\*|redacted|test',
+    re.IGNORECASE,
+)
+
+# Bits per character a generic value needs to count as a secret
+MIN_ENTROPY = 3.0
+
+
+def _trie_pattern(words: List[bytes]) -> bytes:
+    """A regex matching any of `words`, nested by shared prefix.
+
+    The regex engine tries alternatives one by one; as a trie, an offset
+    that cannot start a trigger is rejected after one character instead of
+    after every trigger was tried.
+    """
+    branches: Dict[bytes, List[bytes]] = {}
+    for word in words:
+        branches.setdefault(word[:1], []).append(word[1:])
+    optional = branches.pop(b"", None) is not None
+    alternatives = [re.escape(head) + _trie_pattern(tails) for head, tails in sorted(branches.items())]
+    if not alternatives:
+        return b""
+    pattern = alternatives[0] if len(alternatives) == 1 and not optional else b"(?:" + b"|".join(alternatives) + b")"
+    return pattern + b"?" if optional else pattern
+
+
+def compile_patterns(patterns: Dict[str, Tuple[bytes, Tuple[bytes, ...], str]]) -> Tuple["re.Pattern[bytes]", "re.Pattern[bytes]"]:
+    """The trigger regex and one alternation with a named group per pattern"""
+    triggers = {trigger for _, pattern_triggers, _ in patterns.values() for trigger in pattern_triggers}
+    alternatives = b"|".join(b"(?P<%s>%s)" % (name.encode(), pattern) for name, (pattern, _, _) in patterns.items())
+    return re.compile(_trie_pattern(sorted(triggers))), re.compile(alternatives)
+
+
+def shannon_entropies(tokens: Iterable[str]) -> Dict[str, float]:
+    """Entropy in bits per character of every distinct token.
+
+    A plain loop over `Counter`s rather than a vectorized computation: only
+    keyword-gated generic matches reach this, a handful of short values per
+    diff, and numpy is not a dependency. Deduplicating the tokens is what
+    saves work on repeated values.
+    """
+    entropies = {}
+    for token in set(tokens):
+        length = len(token)
+        entropies[token] = -sum(
+            count / length * math.log2(count / length) for count in Counter(token).values()
+        ) if length else 0.0
+    return entropies
+
+
+def redact(secret: str) -> str:
+    """Enough of a secret to find it again, not enough to use it"""
+    return f"{secret[:4]}…" if len(secret) > 8 else "*" * len(secret)
+
+
+class SecretScanner:
+    """Finds credentials on the added lines of a diff.
+
+    One pass of literal triggers over the (lowercased) buffer picks out the
+    few lines that could hold a secret; those that are added lines are
+    searched with all patterns at once, as one alternation with a named
+    group each. Keyword-gated generic matches are filtered afterwards by
+    entropy, computed once per distinct value.
+    """
+
+    id = "secret"
+    recommendation = "Keep credentials out of the source code and rotate any that were pushed"
+
+    def __init__(self, patterns: Optional[Dict[str, Tuple[bytes, Tuple[bytes, ...], str]]] = None, min_entropy: float = MIN_ENTROPY):
+        self.patterns = patterns if patterns is not None else SECRET_PATTERNS
+        self.triggers, self.regex = compile_patterns(self.patterns)
+        self.min_entropy = min_entropy
+
+    def scan(self, diff: Diff) -> List[Issue]:
+        hunks: List[Tuple[FileDiff, Hunk]] = [
+            (file_diff, hunk) for file_diff in diff.files if file_diff.path and not file_diff.deleted
+            for hunk in file_diff.hunks
+        ]
+        bodies = [hunk.body for _, hunk in hunks]
+        buffer = diff.buffer
+        candidates = []
+        for line_start, line_end in self._added_lines(buffer):
+            index = bisect_right(bodies, line_start) - 1
+            if index < 0 or line_start >= hunks[index][1].end:
+                continue
+            for match in self.regex.finditer(buffer, line_start, line_end):
+                candidates.append((match, hunks[index], line_start))
+
+        values = [match.group("value").decode("utf-8", "replace") for match, _, _ in candidates if match.lastgroup == "generic"]
+        entropies = shannon_entropies(values)
+
+        issues = []
+        seen = set()
+        for match, (file_diff, hunk), line_start in candidates:
+            name = match.lastgroup
+            secret = match.group(name).decode("utf-8", "replace")
+            if name == "generic":
+                secret = match.group("value").decode("utf-8", "replace")
+                if _PLACEHOLDER.search(secret) or entropies[secret] < self.min_entropy:
+                    continue
+            line = self._new_line(buffer, hunk, line_start)
+            if (file_diff.path, line, name) in seen:
+                continue
+            seen.add((file_diff.path, line, name))
+            issues.append(Issue(
+                type="error",
+                file=file_diff.path,
+                line=line,
+                message=f"{self.patterns[name][2]} committed (`{redact(secret)}`)",
+                suggestion="Revoke and rotate it, then load it from the environment or a secret store"
+            ))
+        return issues
+
+    def _added_lines(self, buffer) -> Iterator[Tuple[int, int]]:
+        """(start, end) of every added line containing a trigger, each once"""
+        longest = max(len(trigger) for _, triggers, _ in self.patterns.values() for trigger in triggers)
+        scanned = 0
+        for offset in range(0, len(buffer), _SCAN_BLOCK):
+            # Overlap the blocks so triggers across a boundary are still seen
+            window = bytes(buffer[offset:offset + _SCAN_BLOCK + longest]).lower()
+            for trigger in self.triggers.finditer(window):
+                position = offset + trigger.start()
+                if position < scanned:
+                    continue
+                line_start = buffer.rfind(b"\n", 0, position) + 1
+                line_end = buffer.find(b"\n", position)
+                scanned = line_end = len(buffer) if line_end == -1 else line_end
+                if buffer[line_start:line_start + 1] == b"+" and buffer[line_start:line_start + 4] != b"+++ ":
+                    yield line_start, line_end
+
+    @staticmethod
+    def _new_line(buffer, hunk: Hunk, line_start: int) -> int:
+        """New-file line number of the diff line starting at `line_start`"""
+        body = bytes(buffer[hunk.body:line_start])
+        return hunk.new_start + body.count(b"\n") - 1 - body.count(b"\n-") - body.count(b"\n\\")
@@ -0,0 +1,177 @@
+"""
+Single-flight coalescing: concurrent requests for the same work share one execution
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import IO, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from services.events import ReviewEventHandler
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process coalescing is skipped
+    fcntl = None
+
+# How often a process waiting for another one's lock checks it again
+LOCK_POLL_SECONDS = 0.2
+
+_PR_SUBPAGE = re.compile(r'/(files|commits|checks|diffs|overview|pipelines|activity)$')
+
+
+def normalize_pr_url(pr_url: str) -> str:
+    """The same PR however its URL was pasted: case, `www.`, query, fragment, sub-pages"""
+    parts = urlsplit(pr_url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = _PR_SUBPAGE.sub("", parts.path.rstrip("/"))
+    return f"{host}{path}"
+
+
+class _Abandoned(Exception):
+    """The leading caller was cancelled before finishing; a follower takes over"""
+
+
+class _Flight:
+    def __init__(self):
+        self.future: "Future[Any]" = Future()
+        self.subscribers: List[ReviewEventHandler] = []
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome.
+
+    Callers may run on different threads, each with its own event loop (as
+    the Flask job workers do), so the shared outcome is a thread-safe
+    `concurrent.futures.Future`. If the caller running the call listens for
+    progress events, they are forwarded to every caller waiting on it.
+
+    With `lock_dir` set, the call also holds an exclusive file lock for its
+    key, so other processes wait for it instead of repeating the work; they
+    then find its result in the review cache.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, lock_timeout: Optional[float] = None):
+        self.lock_dir = lock_dir if lock_dir is not None else os.getenv("SINGLE_FLIGHT_LOCK_DIR") or None
+        self.lock_timeout = lock_timeout if lock_timeout is not None else float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", "300"))
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[Optional[ReviewEventHandler]], Awaitable[Any]],
+        on_event: Optional[ReviewEventHandler] = None,
+    ) -> Any:
+        """Await `fn(on_event)`, or the identical call already running for `key`"""
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                if on_event is not None:
+                    flight.subscribers.append(on_event)
+            if leader:
+                return await self._lead(key, flight, fn, on_event is not None)
+            try:
+                # Shielded: a follower going away must not cancel the shared call
+                return await asyncio.shield(asyncio.wrap_future(flight.future))
+            except _Abandoned:
+                continue
+            finally:
+                if on_event is not None:
+                    with self._lock:
+                        flight.subscribers.remove(on_event)
+
+    async def _lead(
+        self,
+        key: str,
+        flight: _Flight,
+        fn: Callable[[Optional[ReviewEventHandler]], Awaitable[Any]],
+        listening: bool,
+    ) -> Any:
+        def broadcast(event: str, data: Dict[str, Any]) -> None:
+            with self._lock:
+                subscribers = list(flight.subscribers)
+            for subscriber in subscribers:
+                subscriber(event, data)
+
+        try:
+            async with self._cross_process_lock(key):
+                # Without a listener of its own the call runs as it would
+                # have alone (e.g. without streaming); followers then only
+                # get the outcome
+                result = await fn(broadcast if listening else None)
+        except asyncio.CancelledError:
+            self._finish(key)
+            flight.future.set_exception(_Abandoned())
+            raise
+        except BaseException as e:
+            self._finish(key)
+            flight.future.set_exception(e)
+            raise
+        self._finish(key)
+        flight.future.set_result(result)
+        return result
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            del self._flights[key]
+
+    @contextlib.asynccontextmanager
+    async def _cross_process_lock(self, key: str) -> AsyncIterator[None]:
+        if self.lock_dir is None or fcntl is None:
+            yield
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, hashlib.sha256(key.encode()).hexdigest() + ".lock")
+        file = await self._acquire(path, time.monotonic() + self.lock_timeout)
+        try:
+            yield
+        finally:
+            if file is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+                fcntl.flock(file, fcntl.LOCK_UN)
+                file.close()
+
+    @staticmethod
+    async def _acquire(path: str, deadline: float) -> Optional[IO]:
+        """The locked lock file, or None if waiting for it timed out"""
+        while True:
+            file = open(path, "a")
+            try:
+                while True:
+                    try:
+                        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            # Give up waiting; worst case the work is done twice
+                            file.close()
+                            return None
+                        await asyncio.sleep(LOCK_POLL_SECONDS)
+            except BaseException:
+                file.close()
+                raise
+            # The previous holder removes the file when done; a lock on the
+            # removed file would not exclude anyone, so start over
+            try:
+                if os.stat(path).st_ino == os.fstat(file.fileno()).st_ino:
+                    return file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(file, fcntl.LOCK_UN)
+            file.close()
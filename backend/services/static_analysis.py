@@ -0,0 +1,501 @@
+"""
+Deterministic rule engine run over the parsed diff before (and instead of) the LLM
+"""
+import ast
+import multiprocessing
+import os
+import re
+import textwrap
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from models.diff import Diff
+from models.feedback import Issue, ReviewFeedback
+from services.secret_scanner import SecretScanner
+
+LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "javascript", ".tsx": "javascript",
+    ".go": "go",
+    ".java": "java", ".kt": "java",
+    ".rb": "ruby",
+    ".php": "php",
+    ".rs": "rust",
+}
+
+LOCKFILES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "pdm.lock",
+    "Gemfile.lock", "composer.lock", "Cargo.lock", "go.sum", "mix.lock", "pubspec.lock", "Podfile.lock",
+}
+
+_TEST_PATH = re.compile(r'(^|/)(tests?|__tests__|spec)/|(^|/)test_[^/]*$|_test\.\w+$|\.(test|spec)\.\w+$')
+
+# Issues reported per rule and file before the rest are summarised
+MAX_ISSUES_PER_RULE = 10
+
+# Raw diff bytes handed to a worker process per task
+BATCH_BYTES = 1024 * 1024
+
+
+def language_of(path: Optional[str]) -> Optional[str]:
+    return LANGUAGES.get(os.path.splitext(path or "")[1].lower())
+
+
+def is_lockfile(path: Optional[str]) -> bool:
+    return os.path.basename(path or "") in LOCKFILES
+
+
+# Tokens compared to tell formatting from real changes: string literals are
+# kept whole, so whitespace inside them still counts
+_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`|\w+|\S')
+
+# Languages where leading indentation is part of the meaning
+INDENTED_LANGUAGES = {"python"}
+
+
+class FileChanges:
+    """What one hunk of a file adds and removes, in a form rules can work on"""
+
+    def __init__(self, path: str, language: Optional[str] = None, is_test: Optional[bool] = None):
+        self.path = path
+        self.language = language if language is not None else language_of(path)
+        self.is_test = is_test if is_test is not None else bool(_TEST_PATH.search(path))
+        # (new line number, text) of every added line
+        self.added: List[Tuple[int, str]] = []
+        self.removed: List[str] = []
+        # (first new line number, new-side text, added line numbers) per hunk
+        self.blocks: List[Tuple[int, str, Set[int]]] = []
+        # Both sides of the hunk in order, context included
+        self.old_side: List[str] = []
+        self.new_side: List[str] = []
+
+    @classmethod
+    def from_hunk(cls, path: str, body: str, new_start: int, **kwargs) -> "FileChanges":
+        """Changes of one hunk from the lines after its `@@` header"""
+        changes = cls(path, **kwargs)
+        line_number = new_start
+        added_numbers: Set[int] = set()
+        for line in body.split("\n"):
+            if line.startswith("+"):
+                changes.added.append((line_number, line[1:]))
+                added_numbers.add(line_number)
+                changes.new_side.append(line[1:])
+                line_number += 1
+            elif line.startswith("-"):
+                changes.removed.append(line[1:])
+                changes.old_side.append(line[1:])
+            elif not line.startswith("\\"):
+                changes.new_side.append(line[1:])
+                changes.old_side.append(line[1:])
+                line_number += 1
+        changes.blocks.append((new_start, "\n".join(changes.new_side), added_numbers))
+        return changes
+
+    @property
+    def formatting_only(self) -> bool:
+        """True if both sides have the same tokens, line by line and in order.
+
+        Blank lines are ignored. Where indentation carries meaning it has to
+        match too, so re-indenting a statement into a block is a real change.
+        """
+        indented = self.language in INDENTED_LANGUAGES
+
+        def normalized(lines):
+            for line in lines:
+                tokens = _TOKENS.findall(line)
+                if tokens:
+                    yield (line[:len(line) - len(line.lstrip())] if indented else "", tokens)
+        return list(normalized(self.old_side)) == list(normalized(self.new_side))
+
+
+class FileSlice:
+    """One file of a diff as byte offsets into a buffer, the unit rules run on.
+
+    Hunks are decoded one at a time, so checking a file never holds more
+    than one hunk's text. `detach` copies just this file's bytes out, for
+    handing the file to a worker process.
+    """
+
+    def __init__(self, path: str, buffer, hunks: List[Tuple[int, int, int]]):
+        self.path = path
+        self.language = language_of(path)
+        self.is_test = bool(_TEST_PATH.search(path))
+        self.buffer = buffer
+        # (body start, end, first new line number) per hunk
+        self.hunks = hunks
+
+    @classmethod
+    def from_diff(cls, diff: Diff) -> Iterator["FileSlice"]:
+        for file_diff in diff.files:
+            if file_diff.path is None or file_diff.deleted:
+                continue
+            yield cls(file_diff.path, diff.buffer, [(hunk.body, hunk.end, hunk.new_start) for hunk in file_diff.hunks])
+
+    def __len__(self) -> int:
+        return self.hunks[-1][1] - self.hunks[0][0] if self.hunks else 0
+
+    def detach(self) -> "FileSlice":
+        if not self.hunks:
+            return FileSlice(self.path, b"", [])
+        base = self.hunks[0][0]
+        return FileSlice(
+            self.path,
+            bytes(self.buffer[base:self.hunks[-1][1]]),
+            [(body - base, end - base, new_start) for body, end, new_start in self.hunks]
+        )
+
+    def changes(self) -> Iterator[FileChanges]:
+        for body, end, new_start in self.hunks:
+            # The body starts with the newline ending the `@@` line
+            text = bytes(self.buffer[body + 1:end]).decode("utf-8", "replace").rstrip("\r\n")
+            yield FileChanges.from_hunk(self.path, text, new_start, language=self.language, is_test=self.is_test)
+
+
+class Rule:
+    """A check over the changes of one hunk of a file; `languages` empty means every file"""
+
+    id = "rule"
+    type = "info"
+    languages: Tuple[str, ...] = ()
+    include_tests = True
+    recommendation: Optional[str] = None
+
+    def applies_to(self, changes: FileChanges) -> bool:
+        if changes.is_test and not self.include_tests:
+            return False
+        return not self.languages or changes.language in self.languages
+
+    def check(self, changes: FileChanges) -> Iterable[Issue]:
+        raise NotImplementedError
+
+
+class RegexRule(Rule):
+    """Flags added lines matching `pattern`"""
+
+    def __init__(
+        self,
+        rule_id: str,
+        type: str,
+        pattern: str,
+        message: str,
+        suggestion: Optional[str] = None,
+        languages: Tuple[str, ...] = (),
+        include_tests: bool = True,
+        recommendation: Optional[str] = None,
+        flags: int = 0,
+    ):
+        self.id = rule_id
+        self.type = type
+        self.pattern = re.compile(pattern, flags)
+        self.message = message
+        self.suggestion = suggestion
+        self.languages = languages
+        self.include_tests = include_tests
+        self.recommendation = recommendation
+
+    def check(self, changes: FileChanges) -> Iterable[Issue]:
+        for line_number, text in changes.added:
+            if self.pattern.search(text):
+                yield Issue(
+                    type=self.type,
+                    file=changes.path,
+                    line=line_number,
+                    message=self.message,
+                    suggestion=self.suggestion
+                )
+
+
+class PythonAstRule(Rule):
+    """Checks the syntax tree of each changed Python block.
+
+    Hunks are parsed on their own (dedented), so blocks that are not valid
+    Python out of context are skipped; only nodes on added lines are reported.
+    """
+
+    languages = ("python",)
+
+    def check(self, changes: FileChanges) -> Iterable[Issue]:
+        for first_line, source, added_numbers in changes.blocks:
+            if not added_numbers:
+                continue
+            try:
+                tree = ast.parse(textwrap.dedent(source))
+            except (SyntaxError, ValueError):
+                continue
+            for node, message, suggestion in self.visit(tree):
+                line_number = first_line + node.lineno - 1
+                if line_number in added_numbers:
+                    yield Issue(
+                        type=self.type,
+                        file=changes.path,
+                        line=line_number,
+                        message=message,
+                        suggestion=suggestion
+                    )
+
+    def visit(self, tree: ast.AST) -> Iterable[Tuple[ast.AST, str, Optional[str]]]:
+        raise NotImplementedError
+
+
+class BareExceptRule(PythonAstRule):
+    id = "py-bare-except"
+    type = "warning"
+    recommendation = "Catch specific exceptions instead of using bare `except:`"
+
+    def visit(self, tree):
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ExceptHandler) and node.type is None:
+                yield node, "Bare `except:` also catches KeyboardInterrupt and SystemExit", "Catch `Exception` or a narrower type"
+
+
+class EvalExecRule(PythonAstRule):
+    id = "py-eval-exec"
+    type = "warning"
+    recommendation = "Avoid eval/exec on data that may come from users"
+
+    def visit(self, tree):
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("eval", "exec"):
+                yield node, f"Use of `{node.func.id}()` can execute arbitrary code", "Parse the input explicitly, e.g. with `ast.literal_eval` or `json.loads`"
+
+
+class MutableDefaultRule(PythonAstRule):
+    id = "py-mutable-default"
+    type = "warning"
+    recommendation = "Use None as the default for list/dict/set arguments"
+
+    def visit(self, tree):
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+                    if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                        yield default, f"Mutable default argument in `{node.name}()` is shared between calls", "Default to None and create the value inside the function"
+
+
+class DebuggerRule(PythonAstRule):
+    id = "py-debugger"
+    type = "error"
+    recommendation = "Remove debugger breakpoints before merging"
+
+    def visit(self, tree):
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func
+            if isinstance(func, ast.Name) and func.id == "breakpoint":
+                yield node, "Leftover `breakpoint()` call", "Remove the breakpoint"
+            elif isinstance(func, ast.Attribute) and func.attr == "set_trace":
+                yield node, "Leftover `set_trace()` debugger call", "Remove the breakpoint"
+
+
+RULES: List[Rule] = [
+    RegexRule(
+        "conflict-marker", "error", r'^(<{7}|>{7})( |$)|^={7}$',
+        "Unresolved merge conflict marker", "Resolve the conflict and remove the markers",
+        recommendation="Resolve merge conflicts before requesting review",
+    ),
+    RegexRule(
+        "todo", "info", r'\b(TODO|FIXME|XXX|HACK)\b',
+        "New TODO/FIXME comment", "Track the follow-up in an issue",
+    ),
+    RegexRule(
+        "py-print", "info", r'^\s*print\(',
+        "Debug print statement", "Use the logging module",
+        languages=("python",), include_tests=False,
+        recommendation="Replace print statements with logging",
+    ),
+    RegexRule(
+        "js-console", "info", r'\bconsole\.(log|debug|trace)\(',
+        "Leftover console logging", "Remove it or use the project's logger",
+        languages=("javascript",), include_tests=False,
+        recommendation="Remove console logging from production code",
+    ),
+    RegexRule(
+        "js-debugger", "error", r'^\s*debugger;?\s*$',
+        "Leftover `debugger` statement", "Remove the statement",
+        languages=("javascript",),
+        recommendation="Remove debugger breakpoints before merging",
+    ),
+    BareExceptRule(),
+    EvalExecRule(),
+    MutableDefaultRule(),
+    DebuggerRule(),
+]
+
+
+def register(rule: Rule) -> Rule:
+    """Add a rule to the default rule set"""
+    RULES.append(rule)
+    return rule
+
+
+def check_file(file_slice: FileSlice, rules: List[Rule]) -> Tuple[List[Tuple[str, Issue]], Optional[bool]]:
+    """Run every applicable rule over one file, hunk by hunk.
+
+    Returns (rule id, issue) pairs and whether only formatting changed,
+    which is None when the file changes no lines at all.
+    """
+    found: Dict[str, List[Issue]] = {}
+    extra: Dict[str, int] = {}
+    formatting_only: Optional[bool] = None
+    for changes in file_slice.changes():
+        for rule in rules:
+            if not rule.applies_to(changes):
+                continue
+            issues = found.setdefault(rule.id, [])
+            for issue in rule.check(changes):
+                if len(issues) < MAX_ISSUES_PER_RULE:
+                    issues.append(issue)
+                else:
+                    extra[rule.id] = extra.get(rule.id, 0) + 1
+        if changes.added or changes.removed:
+            formatting_only = formatting_only is not False and changes.formatting_only
+
+    findings = []
+    for rule_id, issues in found.items():
+        findings.extend((rule_id, issue) for issue in issues)
+        if rule_id in extra:
+            findings.append((rule_id, Issue(
+                type="info",
+                file=file_slice.path,
+                message=f"{extra[rule_id]} more `{rule_id}` findings in this file"
+            )))
+    return findings, formatting_only
+
+
+def check_files(file_slices: List[FileSlice], rules: List[Rule]) -> List[Tuple[List[Tuple[str, Issue]], Optional[bool]]]:
+    """`check_file` over a batch of files, one task of the process pool"""
+    return [check_file(file_slice, rules) for file_slice in file_slices]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the apps run worker threads that must not be forked
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+class StaticReport:
+    """Outcome of the rule engine for one diff"""
+
+    def __init__(self, findings: List[Tuple[str, Issue]], files: int, rules: List[Rule], skip_reason: Optional[str] = None):
+        self.issues = [issue for _, issue in findings]
+        self.files = files
+        self.skip_reason = skip_reason
+        fired = {rule_id for rule_id, _ in findings}
+        self.recommendations = list(dict.fromkeys(
+            rule.recommendation for rule in rules if rule.id in fired and rule.recommendation
+        ))
+
+    @staticmethod
+    def score(issues: List[Issue]) -> int:
+        penalty = {"error": 20, "warning": 5, "info": 1}
+        return max(0, 100 - sum(penalty[issue.type] for issue in issues))
+
+    def issues_for(self, paths: Iterable[str]) -> List[Issue]:
+        paths = set(paths)
+        return [issue for issue in self.issues if issue.file in paths]
+
+    def to_feedback(self, summary: Optional[str] = None, paths: Optional[Iterable[str]] = None) -> ReviewFeedback:
+        issues = self.issues if paths is None else self.issues_for(paths)
+        return ReviewFeedback(
+            summary=summary or f"Static analysis of {self.files} files found {len(issues)} issues.",
+            score=self.score(issues),
+            issues=issues,
+            recommendations=self.recommendations
+        )
+
+
+class StaticAnalyzer:
+    """Runs the rule set over every file of a diff.
+
+    Large PRs (at least `parallel_min_files` files) are spread over a pool
+    of `workers` processes; smaller ones are checked inline. Either way the
+    diff is walked file by file: workers get batches of about BATCH_BYTES of
+    raw diff, with only a few batches in flight, and files bigger than a
+    batch are checked inline rather than copied. Secrets are looked for
+    separately, in one pass over the raw diff.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[List[Rule]] = None,
+        workers: Optional[int] = None,
+        parallel_min_files: Optional[int] = None,
+        secrets: Optional[SecretScanner] = None,
+    ):
+        self.rules = rules if rules is not None else RULES
+        self.secrets = secrets or SecretScanner()
+        self.workers = workers or int(os.getenv("STATIC_ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.parallel_min_files = parallel_min_files or int(os.getenv("STATIC_ANALYSIS_PARALLEL_FILES", "50"))
+
+    def analyze(self, diff: Diff) -> StaticReport:
+        files = sum(1 for file_diff in diff.files if file_diff.path is not None and not file_diff.deleted)
+        if self.workers > 1 and files >= self.parallel_min_files:
+            results = self._check_in_pool(FileSlice.from_diff(diff))
+        else:
+            results = (check_file(file_slice, self.rules) for file_slice in FileSlice.from_diff(diff))
+        findings = [(self.secrets.id, issue) for issue in self.secrets.scan(diff)]
+        formatting = []
+        for file_findings, formatting_only in results:
+            findings.extend(file_findings)
+            formatting.append(formatting_only)
+        return StaticReport(findings, files, self.rules + [self.secrets], self._skip_reason(diff, formatting))
+
+    def _check_in_pool(self, file_slices: Iterable[FileSlice]) -> Iterator[Tuple[List[Tuple[str, Issue]], Optional[bool]]]:
+        """Results of `check_file` per file, in order, from the process pool"""
+        pool = _process_pool(self.workers)
+        pending: Deque[Future] = deque()
+        batch: List[FileSlice] = []
+        size = 0
+
+        def submit() -> None:
+            nonlocal batch, size
+            pending.append(pool.submit(check_files, batch, self.rules))
+            batch, size = [], 0
+
+        for file_slice in file_slices:
+            if len(file_slice) > BATCH_BYTES:
+                # Not worth copying out; check it here once earlier files are done
+                if batch:
+                    submit()
+                while pending:
+                    yield from pending.popleft().result()
+                yield check_file(file_slice, self.rules)
+                continue
+            batch.append(file_slice.detach())
+            size += len(file_slice)
+            if size >= BATCH_BYTES:
+                submit()
+                if len(pending) > 2 * self.workers:
+                    yield from pending.popleft().result()
+        if batch:
+            submit()
+        while pending:
+            yield from pending.popleft().result()
+
+    @staticmethod
+    def _skip_reason(diff: Diff, formatting: List[Optional[bool]]) -> Optional[str]:
+        """Why the LLM is not needed for this diff, if it is not.
+
+        `formatting` holds the `check_file` verdict of every file checked.
+        """
+        paths = [file_diff.path or file_diff.old_path for file_diff in diff.files]
+        if not paths or None in paths:
+            return None
+        if all(is_lockfile(path) for path in paths):
+            return "Only lockfiles changed"
+        if (
+            len(formatting) == len(paths)
+            and any(formatting)
+            and all(formatting_only is not False for formatting_only in formatting)
+        ):
+            return "Only formatting changed"
+        return None
@@ -0,0 +1,100 @@
+"""
+Structured output: the ReviewFeedback schema sent to the model, and validation of its answers
+"""
+import copy
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from models.feedback import ReviewFeedback
+
+# text: JSON asked for in the prompt; json_schema: enforced response format;
+# tools: the review is the arguments of a forced function call
+OUTPUT_MODES = ("text", "json_schema", "tools")
+
+TOOL_NAME = "submit_review"
+
+# Validation errors quoted back to the model when asking for a repair
+MAX_REPORTED_ERRORS = 10
+
+_UNSUPPORTED_KEYWORDS = ("title", "default")
+
+
+def _strict(node: Any) -> Any:
+    """Make a pydantic schema acceptable to strict mode: closed objects, every property required"""
+    if isinstance(node, list):
+        return [_strict(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    strict = {
+        key: _strict(value) for key, value in node.items()
+        if key not in _UNSUPPORTED_KEYWORDS and key != "properties"
+    }
+    if "properties" in node:
+        # Field names, not keywords: keep them all
+        strict["properties"] = {name: _strict(value) for name, value in node["properties"].items()}
+    node = strict
+    if node.get("type") == "object" and "properties" in node:
+        # Optional fields stay nullable (anyOf ... null), so requiring them all is lossless
+        node["required"] = list(node["properties"])
+        node["additionalProperties"] = False
+    return node
+
+
+def review_schema() -> Dict[str, Any]:
+    """JSON schema of the model's answer: ReviewFeedback without the usage we add ourselves"""
+    schema = copy.deepcopy(ReviewFeedback.model_json_schema())
+    schema["properties"].pop("usage", None)
+    schema.get("$defs", {}).pop("TokenUsage", None)
+    return _strict(schema)
+
+
+def request_options(mode: str) -> Dict[str, Any]:
+    """Arguments of `chat.completions.create` that enforce `mode`"""
+    if mode == "json_schema":
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "review_feedback", "strict": True, "schema": review_schema()},
+        }}
+    if mode == "tools":
+        return {
+            "tools": [{
+                "type": "function",
+                "function": {
+                    "name": TOOL_NAME,
+                    "description": "Submit the review of this part of the pull request",
+                    "parameters": review_schema(),
+                },
+            }],
+            "tool_choice": {"type": "function", "function": {"name": TOOL_NAME}},
+        }
+    return {}
+
+
+def answer_text(message: Any) -> Optional[str]:
+    """The JSON of a completion message or streamed delta: its content or its tool call's arguments"""
+    if getattr(message, "content", None):
+        return message.content
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if tool_calls and tool_calls[0].function is not None:
+        return tool_calls[0].function.arguments
+    return None
+
+
+def validate_feedback(text: str) -> ReviewFeedback:
+    """Validate the answer straight into the models; raises ValidationError when it does not fit"""
+    feedback = ReviewFeedback.model_validate_json(text or "")
+    feedback.score = max(0, min(100, feedback.score))
+    feedback.usage = None
+    return feedback
+
+
+def describe_error(error: Exception) -> str:
+    """What was wrong with an answer, in terms the model can act on"""
+    if not isinstance(error, ValidationError):
+        return str(error)
+    problems: List[str] = []
+    for detail in error.errors()[:MAX_REPORTED_ERRORS]:
+        location = ".".join(str(part) for part in detail["loc"]) or "answer"
+        problems.append(f"{location}: {detail['msg']}")
+    return "; ".join(problems)
@@ -0,0 +1,121 @@
+"""
+Verification and parsing of pull request webhooks from GitHub, GitLab and Bitbucket
+"""
+import hashlib
+import hmac
+import json
+import os
+from typing import Any, Dict, Mapping, Optional
+
+PROVIDERS = ("github", "gitlab", "bitbucket")
+
+SECRET_VARIABLES = {
+    "github": "GITHUB_WEBHOOK_SECRET",
+    "gitlab": "GITLAB_WEBHOOK_SECRET",
+    "bitbucket": "BITBUCKET_WEBHOOK_SECRET",
+}
+
+# Pull request actions that leave new code to review
+_GITHUB_ACTIONS = {"opened", "reopened", "synchronize", "ready_for_review"}
+_GITLAB_ACTIONS = {"open", "reopen", "update"}
+_BITBUCKET_EVENTS = {"pullrequest:created", "pullrequest:updated"}
+
+
+class WebhookError(Exception):
+    """A delivery that must be rejected, with the HTTP status to reject it with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class WebhookDelivery:
+    """A verified delivery asking for a review of `pr_url` at `head_sha`"""
+
+    def __init__(self, provider: str, delivery_id: Optional[str], pr_url: str, head_sha: Optional[str]):
+        self.provider = provider
+        self.delivery_id = delivery_id
+        self.pr_url = pr_url
+        self.head_sha = head_sha
+
+
+def _secret(provider: str) -> bytes:
+    secret = os.getenv(SECRET_VARIABLES[provider])
+    if not secret:
+        raise WebhookError(403, f"{SECRET_VARIABLES[provider]} is not configured")
+    return secret.encode()
+
+
+def _verify_hmac(secret: bytes, body: bytes, signature: Optional[str]) -> None:
+    """Check a `sha256=<hex>` HMAC signature header"""
+    if not signature or not signature.startswith("sha256="):
+        raise WebhookError(401, "Missing signature")
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, signature[len("sha256="):]):
+        raise WebhookError(401, "Invalid signature")
+
+
+def _json(body: bytes) -> Dict[str, Any]:
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise WebhookError(400, "Body is not JSON")
+
+
+def parse_webhook(provider: str, headers: Mapping[str, str], body: bytes) -> Optional[WebhookDelivery]:
+    """Verify a delivery and extract the review it asks for.
+
+    Returns None for valid deliveries that need no review (pings, closed
+    PRs, edits of the description); raises WebhookError for anything that
+    must be rejected. `headers` must be case-insensitive.
+    """
+    if provider == "github":
+        _verify_hmac(_secret(provider), body, headers.get("X-Hub-Signature-256"))
+        if headers.get("X-GitHub-Event") != "pull_request":
+            return None
+        payload = _json(body)
+        if payload.get("action") not in _GITHUB_ACTIONS:
+            return None
+        pull_request = payload.get("pull_request") or {}
+        return WebhookDelivery(
+            provider,
+            headers.get("X-GitHub-Delivery"),
+            pull_request.get("html_url"),
+            (pull_request.get("head") or {}).get("sha"),
+        ) if pull_request.get("html_url") else None
+
+    if provider == "gitlab":
+        # GitLab sends the secret token itself rather than a signature
+        token = headers.get("X-Gitlab-Token") or ""
+        if not hmac.compare_digest(_secret(provider), token.encode()):
+            raise WebhookError(401, "Invalid token")
+        if headers.get("X-Gitlab-Event") != "Merge Request Hook":
+            return None
+        payload = _json(body)
+        attributes = payload.get("object_attributes") or {}
+        action = attributes.get("action")
+        # `update` also fires for title/label edits; only new commits carry `oldrev`
+        if action not in _GITLAB_ACTIONS or (action == "update" and not attributes.get("oldrev")):
+            return None
+        return WebhookDelivery(
+            provider,
+            headers.get("X-Gitlab-Event-UUID") or headers.get("Idempotency-Key"),
+            attributes.get("url"),
+            (attributes.get("last_commit") or {}).get("id"),
+        ) if attributes.get("url") else None
+
+    if provider == "bitbucket":
+        _verify_hmac(_secret(provider), body, headers.get("X-Hub-Signature"))
+        if headers.get("X-Event-Key") not in _BITBUCKET_EVENTS:
+            return None
+        payload = _json(body)
+        pull_request = payload.get("pullrequest") or {}
+        pr_url = ((pull_request.get("links") or {}).get("html") or {}).get("href")
+        return WebhookDelivery(
+            provider,
+            headers.get("X-Request-UUID"),
+            pr_url,
+            ((pull_request.get("source") or {}).get("commit") or {}).get("hash"),
+        ) if pr_url else None
+
+    raise WebhookError(404, f"Unknown provider: {provider}")
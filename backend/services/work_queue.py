@@ -0,0 +1,310 @@
+"""
+Durable SQLite-backed queue of review jobs, shared by any number of worker processes
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class QueuedReview:
+    """One claimed job: the PR to review, how often it was tried and who holds its lease"""
+
+    def __init__(self, job_id: int, pr_url: str, head_sha: Optional[str], provider: str, attempts: int, worker: str):
+        self.id = job_id
+        self.pr_url = pr_url
+        self.head_sha = head_sha
+        self.provider = provider
+        self.attempts = attempts
+        self.worker = worker
+
+
+# Updates by a worker only apply while it still holds the job's lease
+_LEASED = "WHERE id = ? AND status = 'running' AND worker = ?"
+
+
+class WorkQueue:
+    """Review jobs and webhook delivery IDs in a WAL-mode SQLite database.
+
+    Enqueueing is a single short transaction, so webhook handlers return
+    at once. Workers in any process `claim` jobs under a lease; a job whose
+    worker died becomes claimable again once its lease runs out. Pushes to
+    a PR that is still waiting are folded into its one queued job, so
+    bursts do not multiply the work. Finished jobs keep their feedback, so
+    a caller can `wait` for a review it queued.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        lease_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        delivery_ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.path = path or os.getenv("WORK_QUEUE_PATH", "work_queue.db")
+        self.lease_seconds = lease_seconds or float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "900"))
+        self.max_attempts = max_attempts or int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+        self.delivery_ttl_seconds = delivery_ttl_seconds
+        # How often workers report themselves alive; three missed beats make one unhealthy
+        self.heartbeat_seconds = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "10"))
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pr_url TEXT NOT NULL,
+                    head_sha TEXT,
+                    provider TEXT NOT NULL,
+                    delivery_id TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_until REAL,
+                    worker TEXT,
+                    error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_queued_pr ON jobs (pr_url) WHERE status = 'queued';
+                CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, available_at);
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    id TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    received_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_deliveries_received_at ON deliveries (received_at);
+                CREATE TABLE IF NOT EXISTS workers (
+                    name TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    running INTEGER NOT NULL DEFAULT 0,
+                    processed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    started_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                );
+                """
+            )
+            # Queues created before results were kept
+            if "result" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN result TEXT")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, pr_url: str, provider: str, head_sha: Optional[str] = None, delivery_id: Optional[str] = None) -> Optional[int]:
+        """Queue a review; returns the job id, or None for an already seen delivery"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if delivery_id is not None:
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO deliveries (id, provider, received_at) VALUES (?, ?, ?)",
+                    (delivery_id, provider, now),
+                ).rowcount
+                if not inserted:
+                    conn.execute("COMMIT")
+                    return None
+            # A PR already waiting keeps its place and just moves to the new head.
+            # New code, or a request for whatever the head is now (no SHA), is a
+            # fresh review: the backoff and failed attempts of the old head go.
+            job_id = conn.execute(
+                "INSERT INTO jobs (pr_url, head_sha, provider, delivery_id, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (pr_url) WHERE status = 'queued' "
+                "DO UPDATE SET head_sha = COALESCE(excluded.head_sha, head_sha), "
+                "delivery_id = COALESCE(excluded.delivery_id, delivery_id), "
+                "attempts = CASE WHEN excluded.head_sha IS NOT head_sha OR excluded.head_sha IS NULL THEN 0 ELSE attempts END, "
+                "available_at = CASE WHEN excluded.head_sha IS NOT head_sha OR excluded.head_sha IS NULL "
+                "THEN MIN(available_at, excluded.available_at) ELSE available_at END, "
+                "error = CASE WHEN excluded.head_sha IS NOT head_sha OR excluded.head_sha IS NULL THEN NULL ELSE error END "
+                "RETURNING id",
+                (pr_url, head_sha, provider, delivery_id, now, now),
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim(self, worker: str) -> Optional[QueuedReview]:
+        """Take the oldest available job, or one whose worker's lease expired.
+
+        A job whose lease ran out on its last allowed attempt has most likely
+        killed its worker every time; it is failed rather than leased again.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, error = ?, finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                ("Lease expired on the last attempt", now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY available_at, id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ? RETURNING id, pr_url, head_sha, provider, attempts, worker",
+                (worker, now + self.lease_seconds, row[0]),
+            ).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return QueuedReview(*claimed)
+
+    def complete(self, job: QueuedReview, result: Optional[str] = None) -> bool:
+        """Mark a job done, keeping its serialized feedback for whoever waits on it.
+
+        Like `fail` and `release`, returns False if the lease was lost: the
+        lease expired and another worker claimed the job, which now owns it.
+        """
+        return self._connection().execute(
+            f"UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, result = ?, finished_at = ? {_LEASED}",
+            (result, time.time(), job.id, job.worker),
+        ).rowcount > 0
+
+    def job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT id, pr_url, status, attempts, error, result FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "pr_url", "status", "attempts", "error", "result"), row))
+
+    async def wait(self, job_id: int, timeout: float, poll_interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Poll a job until it is done or failed; None if it is not finished within `timeout`.
+
+        A job superseded by a newer one for the same PR is followed to that job.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if job["status"] == "superseded":
+                newer = self._connection().execute(
+                    "SELECT id FROM jobs WHERE pr_url = ? AND id > ? ORDER BY id LIMIT 1", (job["pr_url"], job_id)
+                ).fetchone()
+                if newer is None:
+                    return job
+                job_id = newer[0]
+                continue
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(poll_interval)
+
+    def fail(self, job: QueuedReview, error: str, retry_delay: float = 60.0) -> bool:
+        """Record a failed attempt; the job is retried with backoff up to `max_attempts`"""
+        now = time.time()
+        conn = self._connection()
+        if job.attempts >= self.max_attempts:
+            return conn.execute(
+                f"UPDATE jobs SET status = 'failed', lease_until = NULL, error = ?, finished_at = ? {_LEASED}",
+                (error, now, job.id, job.worker),
+            ).rowcount > 0
+        try:
+            return conn.execute(
+                f"UPDATE jobs SET status = 'queued', lease_until = NULL, error = ?, available_at = ? {_LEASED}",
+                (error, now + retry_delay * 2 ** (job.attempts - 1), job.id, job.worker),
+            ).rowcount > 0
+        except sqlite3.IntegrityError:
+            # A newer push queued the PR again meanwhile; that job covers this one
+            return conn.execute(
+                f"UPDATE jobs SET status = 'superseded', error = ?, finished_at = ? {_LEASED}",
+                (error, now, job.id, job.worker),
+            ).rowcount > 0
+
+    def release(self, job: QueuedReview) -> bool:
+        """Put a claimed job back without counting the attempt (e.g. on shutdown)"""
+        conn = self._connection()
+        try:
+            return conn.execute(
+                f"UPDATE jobs SET status = 'queued', lease_until = NULL, attempts = attempts - 1 {_LEASED}",
+                (job.id, job.worker),
+            ).rowcount > 0
+        except sqlite3.IntegrityError:
+            return conn.execute(
+                f"UPDATE jobs SET status = 'superseded', finished_at = ? {_LEASED}",
+                (time.time(), job.id, job.worker),
+            ).rowcount > 0
+
+    def prune(self, max_age_seconds: Optional[float] = None) -> int:
+        """Forget old delivery IDs and finished jobs; returns the rows removed"""
+        cutoff = time.time() - (max_age_seconds or self.delivery_ttl_seconds)
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM deliveries WHERE received_at < ?", (cutoff,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'superseded') AND finished_at < ?", (cutoff,)
+        ).rowcount
+        return removed
+
+    def heartbeat(self, name: str, pid: int, state: str, running: int, processed: int, failed: int) -> None:
+        """Record that a worker is alive and what it is doing"""
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO workers (name, pid, state, running, processed, failed, started_at, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET state = excluded.state, running = excluded.running, "
+            "processed = excluded.processed, failed = excluded.failed, heartbeat_at = excluded.heartbeat_at",
+            (name, pid, state, running, processed, failed, now, now),
+        )
+
+    def remove_worker(self, name: str) -> None:
+        self._connection().execute("DELETE FROM workers WHERE name = ?", (name,))
+
+    def workers(self, stale_after: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Every registered worker; `healthy` is False once its heartbeat is older than `stale_after`"""
+        stale_after = stale_after or 3 * self.heartbeat_seconds
+        now = time.time()
+        conn = self._connection()
+        # Workers that stopped beating long ago are gone for good
+        conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - 10 * stale_after,))
+        rows = conn.execute(
+            "SELECT name, pid, state, running, processed, failed, started_at, heartbeat_at FROM workers ORDER BY name"
+        ).fetchall()
+        return [
+            {
+                "name": name,
+                "pid": pid,
+                "state": state,
+                "healthy": now - heartbeat_at <= stale_after,
+                "running": running,
+                "processed": processed,
+                "failed": failed,
+                "uptime_seconds": round(now - started_at, 1),
+                "last_heartbeat_seconds": round(now - heartbeat_at, 1),
+            }
+            for name, pid, state, running, processed, failed, started_at, heartbeat_at in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = self._connection().execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        }
@@ -2,12 +2,18 @@
 """
 Startup script for the PR Review Agent backend
 """
+import argparse
 import os
+import signal
 import sys
 import subprocess
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
+# Seconds a review worker must have run before a crash restarts it immediately
+MIN_UPTIME_SECONDS = 10
+
 def check_requirements():
     """Check if required environment variables are set"""
     # Load environment variables from .env file
@@ -54,8 +60,88 @@ def start_server():
     except KeyboardInterrupt:
         print("\n[STOPPED] Server stopped")
 
+def start_production(host, port, http_workers, review_workers, drain_timeout):
+    """Run uvicorn workers for HTTP and a pool of review worker processes.
+
+    All processes share the SQLite work queue, review cache and HTTP cache
+    in this directory. With review workers, POST /analyze and webhook
+    reviews both run in the pool; /analyze/stream stays in the HTTP
+    workers, which stream its progress. Review workers that crash are
+    restarted. On SIGTERM or Ctrl+C every process is asked to stop; review
+    workers finish their running reviews for up to `drain_timeout` seconds
+    before being killed.
+    """
+    # Lets concurrent reviews of one PR in different processes coalesce
+    env = dict(os.environ)
+    env.setdefault("SINGLE_FLIGHT_LOCK_DIR", ".single_flight")
+    if review_workers:
+        env["ANALYZE_ON_QUEUE"] = "1"
+
+    print(f"[STARTING] {http_workers} HTTP workers on http://{host}:{port}, {review_workers} review workers")
+    http = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", host, "--port", str(port),
+        "--workers", str(http_workers),
+        "--timeout-graceful-shutdown", str(int(drain_timeout)),
+    ], env=env)
+    worker_command = [sys.executable, "worker.py", "--drain-timeout", str(drain_timeout)]
+    workers = {index: (subprocess.Popen(worker_command, env=env), time.monotonic()) for index in range(review_workers)}
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    while not stopping:
+        if http.poll() is not None:
+            print(f"[ERROR] HTTP server exited with code {http.returncode}")
+            break
+        for index, (process, started) in list(workers.items()):
+            if process.poll() is None:
+                continue
+            uptime = time.monotonic() - started
+            print(f"[WARNING] Review worker {process.pid} exited with code {process.returncode}, restarting")
+            if uptime < MIN_UPTIME_SECONDS:
+                # Crashing on start: don't spin
+                time.sleep(MIN_UPTIME_SECONDS - uptime)
+            workers[index] = (subprocess.Popen(worker_command, env=env), time.monotonic())
+        time.sleep(1)
+
+    print("[STOPPING] Draining workers...")
+    processes = [http] + [process for process, _ in workers.values()]
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + drain_timeout + 5
+    for process in processes:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    print("[STOPPED] All workers stopped")
+    return 0 if stopping else 1
+
 def main():
     """Main startup function"""
+    parser = argparse.ArgumentParser(description="Start the PR Review Agent backend")
+    parser.add_argument('--production', action='store_true',
+                       help='Serve main.py with several uvicorn workers plus a pool of review workers')
+    parser.add_argument('--http-workers', type=int, default=int(os.getenv('HTTP_WORKERS', str(os.cpu_count() or 1))),
+                       help='uvicorn worker processes in production mode (default: HTTP_WORKERS or CPU count)')
+    parser.add_argument('--review-workers', type=int, default=int(os.getenv('REVIEW_WORKERS', '2')),
+                       help='Review worker processes in production mode (default: REVIEW_WORKERS or 2)')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'), help='Address to bind (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')), help='Port to bind (default: 8000)')
+    parser.add_argument('--drain-timeout', type=float, default=float(os.getenv('WORKER_DRAIN_SECONDS', '300')),
+                       help='Seconds running reviews get to finish on shutdown (default: WORKER_DRAIN_SECONDS or 300)')
+    parser.add_argument('--skip-install', action='store_true', help='Do not pip install the requirements first')
+    args = parser.parse_args()
+    
     print("PR Review Agent Backend")
     print("=" * 30)
     
@@ -69,11 +155,15 @@ def main():
         sys.exit(1)
     
     # Install requirements
-    if not install_requirements():
+    if not args.skip_install and not install_requirements():
         sys.exit(1)
     
     # Start server
+    if args.production:
+        sys.exit(start_production(
+            args.host, args.port, max(args.http_workers, 1), max(args.review_workers, 0), args.drain_timeout
+        ))
     start_server()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
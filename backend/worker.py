@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Review worker: drains the durable work queue filled by the webhook endpoints,
+and in production mode (start.py --production) by POST /analyze as well
+
+Run as many of these processes as needed; each claims jobs from the shared
+SQLite queue, so a burst of pushes is worked off at a steady rate.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+from dotenv import load_dotenv
+
+from services.pr_analyzer import PRAnalyzer
+from services.history_store import HistoryStore
+from services.http_client import aclose_clients
+from services.review_pipeline import review_pr
+from services.work_queue import WorkQueue
+
+load_dotenv()
+
+# How often finished jobs and old delivery IDs are cleaned up
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class ReviewWorker:
+    """Claims queued reviews and runs up to `concurrency` of them at once.
+
+    With `rate` set, reviews start at most `rate` times per second in this
+    process, however many are waiting.
+    """
+
+    def __init__(self, queue=None, analyzer=None, history=None, concurrency=2, rate=0.0, poll_interval=1.0):
+        self.queue = queue or WorkQueue()
+        self.analyzer = analyzer or PRAnalyzer()
+        self.history = history or HistoryStore()
+        self.concurrency = concurrency
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.state = "starting"
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self._next_start = 0.0
+        self._claim_lock = asyncio.Lock()
+
+    async def run(self, stop: asyncio.Event, drain_timeout: float = 300.0) -> None:
+        """Work until `stop` is set, then give running reviews `drain_timeout` seconds to finish.
+
+        Reviews still running after that are cancelled and go back to the
+        queue for another worker.
+        """
+        self.state = "running"
+        heartbeat = asyncio.create_task(self._heartbeat())
+        prune = asyncio.create_task(self._prune_periodically(stop))
+        slots = [asyncio.create_task(self._slot(index, stop)) for index in range(self.concurrency)]
+        try:
+            await stop.wait()
+            self.state = "draining"
+            self._beat()
+            _, unfinished = await asyncio.wait(slots, timeout=drain_timeout)
+            for slot in unfinished:
+                slot.cancel()
+            await asyncio.gather(*slots, prune, return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+            self.queue.remove_worker(self.name)
+
+    async def _slot(self, index: int, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                job = await self._claim(f"{self.name}:{index}", stop)
+            except Exception as e:
+                # e.g. the queue database stayed locked; keep the slot alive
+                print(f"❌ Claiming a job failed: {e}", file=sys.stderr)
+                job = None
+            if job is None:
+                # Queue empty: wait a little, or until asked to stop
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.running += 1
+            try:
+                await self._review(job)
+            finally:
+                self.running -= 1
+
+    async def _claim(self, worker: str, stop: asyncio.Event):
+        # Claims are serialised so the pacing holds across this process's slots
+        async with self._claim_lock:
+            delay = self._next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if stop.is_set():
+                return None
+            job = self.queue.claim(worker)
+            if job is not None and self.rate > 0:
+                self._next_start = max(self._next_start, time.monotonic()) + 1 / self.rate
+            return job
+
+    async def _review(self, job) -> None:
+        start = time.perf_counter()
+        try:
+            pr_data, feedback = await review_pr(job.pr_url, self.analyzer)
+        except asyncio.CancelledError:
+            self.queue.release(job)
+            raise
+        except Exception as e:
+            self.failed += 1
+            if not self.queue.fail(job, str(e)):
+                self._lease_lost(job)
+            print(f"❌ {job.pr_url} (attempt {job.attempts}): {e}", file=sys.stderr)
+            return
+        if not self.queue.complete(job, feedback.model_dump_json()):
+            # The worker that took the job over records it instead
+            self._lease_lost(job)
+            return
+        self.processed += 1
+        self.history.add({
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "pr_url": job.pr_url,
+            "pr_title": pr_data.title,
+            "author": pr_data.author,
+            "score": feedback.score,
+            "issues_count": len(feedback.issues),
+            "summary": feedback.summary
+        })
+        print(f"✅ {job.pr_url}: score {feedback.score} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    @staticmethod
+    def _lease_lost(job) -> None:
+        print(f"⚠️ {job.pr_url}: lease expired and job {job.id} was claimed again; result dropped", file=sys.stderr)
+
+    def _beat(self) -> None:
+        self.queue.heartbeat(self.name, os.getpid(), self.state, self.running, self.processed, self.failed)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat()
+            await asyncio.sleep(self.queue.heartbeat_seconds)
+
+    async def _prune_periodically(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            self.queue.prune()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=PRUNE_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_worker(concurrency, rate, poll_interval, drain_timeout):
+    worker = ReviewWorker(concurrency=concurrency, rate=rate, poll_interval=poll_interval)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"👷 Worker {worker.name} draining {worker.queue.path} "
+          f"({concurrency} at a time{f', {rate}/s' if rate else ''})", file=sys.stderr)
+    try:
+        await worker.run(stop, drain_timeout)
+    finally:
+        await aclose_clients()
+    print(f"👋 Stopped after {worker.processed} reviews ({worker.failed} failed)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the review queue")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', '2')),
+                       help='Reviews run at once by this process (default: WORKER_CONCURRENCY or 2)')
+    parser.add_argument('--rate', type=float, default=float(os.getenv('WORKER_RATE', '0')),
+                       help='Most reviews started per second by this process, 0 for no limit (default: WORKER_RATE or 0)')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                       help='Seconds between checks of an empty queue (default: 1)')
+    parser.add_argument('--drain-timeout', type=float, default=float(os.getenv('WORKER_DRAIN_SECONDS', '300')),
+                       help='Seconds running reviews get to finish after SIGTERM (default: WORKER_DRAIN_SECONDS or 300)')
+    args = parser.parse_args()
+
+    if not os.getenv('OPENAI_API_KEY'):
+        print("❌ Error: OPENAI_API_KEY environment variable not set")
+        sys.exit(1)
+
+    asyncio.run(run_worker(max(args.concurrency, 1), args.rate, args.poll_interval, args.drain_timeout))
+
+if __name__ == "__main__":
+    main()
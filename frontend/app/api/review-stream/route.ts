@@ -0,0 +1,47 @@
+import { type NextRequest, NextResponse } from "next/server";
+
+const BACKEND_URL = process.env.BACKEND_URL || "http://127.0.0.1:8000";
+
+// Proxy the backend's Server-Sent Events stream of review progress
+export async function GET(request: NextRequest) {
+  const prUrl = request.nextUrl.searchParams.get("prUrl");
+
+  if (!prUrl) {
+    return NextResponse.json({ error: "PR URL is required" }, { status: 400 });
+  }
+
+  try {
+    const response = await fetch(
+      `${BACKEND_URL}/analyze/stream?prUrl=${encodeURIComponent(prUrl)}`,
+      {
+        headers: { Accept: "text/event-stream" },
+        cache: "no-store",
+        signal: request.signal,
+      }
+    );
+
+    if (!response.ok || !response.body) {
+      return NextResponse.json(
+        { error: "Backend could not start the review" },
+        { status: response.status || 502 }
+      );
+    }
+
+    return new Response(response.body, {
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache, no-transform",
+        Connection: "keep-alive",
+      },
+    });
+  } catch (error) {
+    console.log(
+      "Backend unreachable for streaming review:",
+      error instanceof Error ? error.message : "Unknown error"
+    );
+    return NextResponse.json(
+      { error: "Backend unreachable" },
+      { status: 502 }
+    );
+  }
+}
@@ -29,45 +29,50 @@ export default function HomePage() {
   const [feedback, setFeedback] = useState<ReviewFeedback | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [progress, setProgress] = useState<string>("");
+  const [liveOutput, setLiveOutput] = useState<string>("");
 
-  const handleSubmitPR = async (prUrl: string) => {
+  const handleSubmitPR = (prUrl: string) => {
     setIsLoading(true);
     setError(null);
     setFeedback(null);
+    setProgress("Submitting pull request...");
+    setLiveOutput("");
 
-    try {
-      // Submit PR URL to Python backend
-      const response = await fetch("/api/review-pr", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ prUrl }),
-      });
+    // Stream review progress from the Python backend
+    const source = new EventSource(
+      `/api/review-stream?prUrl=${encodeURIComponent(prUrl)}`
+    );
+    let chunks = 1;
+    let reviewed = 0;
 
-      if (!response.ok) {
-        throw new Error("Failed to submit PR for review");
-      }
-
-      // Poll for feedback.json
-      const pollForFeedback = async () => {
-        const feedbackResponse = await fetch("/api/feedback");
-        if (feedbackResponse.ok) {
-          const feedbackData = await feedbackResponse.json();
-          setFeedback(feedbackData);
-          setIsLoading(false);
-        } else {
-          // Continue polling if feedback not ready
-          setTimeout(pollForFeedback, 2000);
-        }
-      };
-
-      // Start polling after a short delay
-      setTimeout(pollForFeedback, 1000);
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred");
+    source.addEventListener("fetching", () =>
+      setProgress("Fetching PR metadata and diff...")
+    );
+    source.addEventListener("diff_parsed", (event) => {
+      chunks = JSON.parse((event as MessageEvent).data).chunks;
+      setProgress(`Reviewing ${chunks} part(s) of the diff...`);
+    });
+    source.addEventListener("token", (event) => {
+      const { text } = JSON.parse((event as MessageEvent).data);
+      // Keep the tail of the live model output visible
+      setLiveOutput((output) => (output + text).slice(-2000));
+    });
+    source.addEventListener("chunk_reviewed", () => {
+      reviewed++;
+      setProgress(`Reviewed ${reviewed} of ${chunks} part(s)...`);
+    });
+    source.addEventListener("feedback", (event) => {
+      source.close();
+      setFeedback(JSON.parse((event as MessageEvent).data));
+      setIsLoading(false);
+    });
+    source.addEventListener("error", (event) => {
+      source.close();
+      const data = (event as MessageEvent).data;
+      setError(data ? JSON.parse(data).message : "Review stream failed");
       setIsLoading(false);
-    }
+    });
   };
 
   return (
@@ -124,9 +129,14 @@ export default function HomePage() {
                       Analyzing Pull Request
                     </h3>
                     <p className="text-muted-foreground">
-                      Our AI is reviewing your code...
+                      {progress || "Our AI is reviewing your code..."}
                     </p>
                   </div>
+                  {liveOutput && (
+                    <pre className="w-full max-h-48 overflow-hidden whitespace-pre-wrap break-words text-xs text-muted-foreground">
+                      {liveOutput}
+                    </pre>
+                  )}
                 </div>
               </CardContent>
             </Card>